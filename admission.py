@@ -0,0 +1,97 @@
+import math
+import threading
+import time
+
+from werkzeug.wsgi import ClosingIterator
+
+# Weight of the latest request in the moving average of service time
+SERVICE_TIME_SMOOTHING = 0.1
+
+
+# Bounded concurrency for one class of requests. Up to max_in_flight run at once and
+# up to max_queue wait for a slot. A request is turned away at once if the queue is
+# full or the expected wait (queue depth x average service time / slots) exceeds
+# queue_timeout, and after queue_timeout if it still has no slot, so admitted
+# requests never wait longer than that.
+class Lane:
+    def __init__(self, name, max_in_flight, max_queue, queue_timeout, initial_service_time=0.05):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.service_time = initial_service_time
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.condition = threading.Condition()
+
+    def expected_wait(self):
+        return (self.waiting + 1) * self.service_time / self.max_in_flight
+
+    def acquire(self):
+        with self.condition:
+            if self.in_flight < self.max_in_flight and not self.waiting:
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            if self.waiting >= self.max_queue or self.expected_wait() > self.queue_timeout:
+                self.shed += 1
+                return False
+            self.waiting += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self.in_flight >= self.max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed += 1
+                        return False
+                    self.condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self, seconds):
+        with self.condition:
+            self.in_flight -= 1
+            self.service_time += SERVICE_TIME_SMOOTHING * (seconds - self.service_time)
+            self.condition.notify()
+
+    # Whole seconds until the current queue should have drained
+    def retry_after(self):
+        with self.condition:
+            return max(1, math.ceil(self.expected_wait()))
+
+    def stats(self):
+        with self.condition:
+            return {'in_flight': self.in_flight, 'waiting': self.waiting, 'admitted': self.admitted,
+                    'shed': self.shed, 'service_seconds': self.service_time}
+
+
+# WSGI middleware that sends each request path through its lane. Paths without a
+# lane pass straight through. A slot is held until the response body is closed, so
+# a streamed export keeps its slot while it is being sent. Requests that are not
+# admitted get 503 with a Retry-After based on the lane's queue depth.
+class AdmissionControl:
+    def __init__(self, app, lanes, routes):
+        self.app = app
+        self.lanes = lanes
+        self.routes = routes
+
+    def __call__(self, environ, start_response):
+        lane = self.lanes.get(self.routes.get(environ.get('PATH_INFO', '')))
+        if lane is None:
+            return self.app(environ, start_response)
+        if not lane.acquire():
+            start_response('503 Service Unavailable', [('Content-Type', 'text/plain'),
+                                                       ('Retry-After', str(lane.retry_after()))])
+            return [b'Service busy, please retry shortly.\n']
+        start = time.perf_counter()
+        try:
+            body = self.app(environ, start_response)
+        except BaseException:
+            lane.release(time.perf_counter() - start)
+            raise
+        return ClosingIterator(body, lambda: lane.release(time.perf_counter() - start))
@@ -1,17 +1,24 @@
-import pandas as pd
 import firebase_admin
-from firebase_admin import credentials, auth
-from flask import Flask, request, render_template_string, send_file, abort
+from firebase_admin import credentials
+from flask import Flask, Response, g, request, send_file, abort
 import os
 import urllib.parse
 import logging
 import re
+import time
+from admission import AdmissionControl, Lane
+from cache import ResultStore
+from engine import FILTER_COLUMNS, LiveEngine, Query
+from export import EXPORT_FORMATS, iter_export, iter_gzip
+from metrics import REQUEST_SECONDS, STAGE_SECONDS, render_values, timed_chunks
+from render import EnginePages
+from tokens import TokenVerifier
 
 # Initialize Flask app
 app = Flask(__name__)
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# Set up logging; LOG_LEVEL=DEBUG turns on per-request detail
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
 # Define HTML templates
@@ -154,19 +161,7 @@ RESULTS_HTML = """
                 </tr>
             </thead>
             <tbody>
-                {% for result in results %}
-                    <tr>
-                        <td>{{ result['Institute'] }}</td>
-                        <td>{{ result['Program'] }}</td>
-                        <td>{{ result['Round'] }}</td>
-                        <td>{{ result['Category'] }}</td>
-                        <td>{{ result['Quota'] }}</td>
-                        <td>{{ result['Seat Type'] }}</td>
-                        <td>{{ result['Opening Rank'] }}</td>
-                        <td>{{ result['Closing Rank'] }}</td>
-                        <td>{{ result['Year'] }}</td>
-                    </tr>
-                {% endfor %}
+                {{ rows }}
             </tbody>
         </table>
         <div class="pagination">
@@ -177,41 +172,64 @@ RESULTS_HTML = """
                 <a href="/predict?rank={{ form_data.get('rank') }}&program={{ form_data.get('program') }}&stream={{ form_data.get('stream') }}&category={{ form_data.get('category') }}&quota={{ form_data.get('quota') }}&seat_type={{ form_data.get('seat_type') }}&round={{ form_data.get('round') }}&year={{ form_data.get('year') }}&page={{ page + 1 }}">Next</a>
             {% endif %}
         </div>
-        <a href="/download" class="download-btn">Download Results as CSV</a>
+        <a href="/download?rank={{ form_data.get('rank') }}&program={{ form_data.get('program') }}&stream={{ form_data.get('stream') }}&category={{ form_data.get('category') }}&quota={{ form_data.get('quota') }}&seat_type={{ form_data.get('seat_type') }}&round={{ form_data.get('round') }}&year={{ form_data.get('year') }}" class="download-btn">Download Results as CSV</a>
         <p><a href="/">Back to Predictor</a></p>
     </div>
 </body>
 </html>
 """
 
-# Load and preprocess data
-data_file_path = 'wbjee_final_clean.xls'  # Local relative path
-if os.environ.get('RENDER', 'False') == 'True':
-    data_file_path = '/app/data/wbjee_final_clean.xls'  # Render disk path
-data = pd.read_csv(data_file_path)
-
-# Handle missing values
-data['Seat Type'] = data['Seat Type'].fillna('Unknown')
-data['Stream'] = data['Stream'].fillna('Unknown')
-data['Program'] = data['Program'].fillna('Unknown')
-data['Category'] = data['Category'].fillna('Unknown')
-
-# Normalize columns
-for col in ['Program', 'Institute', 'Category', 'Quota', 'Round', 'Seat Type']:
-    data[col] = data[col].str.strip().str.title().str.replace('  ', ' ').str.replace('&', 'And')
-data['Stream'] = data['Stream'].str.strip().str.replace(r'[./]', '/', regex=True).str.replace('  ', ' ').str.title()
-data['Category'] = data['Category'].str.replace('Obc - A', 'Obc-A').str.replace('Obc - B', 'Obc-B')
-data['Program'] = data['Program'].str.replace(r'\s*\(.*\)', '', regex=True)
-data['Year'] = pd.to_numeric(data['Year'], errors='coerce').fillna(0).astype(int)
-data = data.drop_duplicates()
+# Compile the templates once instead of on every request
+index_template = app.jinja_env.from_string(INDEX_HTML)
+results_template = app.jinja_env.from_string(RESULTS_HTML)
+
+# Load and preprocess data; newly published snapshots are picked up while running
+live = LiveEngine()
+
+# Columns shown for each result row
+RESULT_COLUMNS = ['Institute', 'Program', 'Round', 'Category', 'Quota', 'Seat Type', 'Opening Rank', 'Closing Rank', 'Year']
+
+# Limits for the JSON API
+MAX_BATCH_QUERIES = 500
+MAX_API_PAGE_SIZE = 1000
+
+# Admission limits per worker process; gunicorn.conf.py sizes the thread pool to cover
+# them. Queries are CPU-bound and get a few slots. Exports mostly wait on the client
+# and get their own, so a slow download never holds up a prediction. Requests that
+# cannot be admitted within QUEUE_TIMEOUT seconds get 503 with Retry-After.
+QUEUE_TIMEOUT = float(os.environ.get('QUEUE_TIMEOUT', 2.0))
+ADMISSION_LANES = {
+    'query': Lane('query', int(os.environ.get('QUERY_MAX_IN_FLIGHT', 4)), int(os.environ.get('QUERY_MAX_QUEUE', 16)),
+                  QUEUE_TIMEOUT, initial_service_time=0.005),
+    'export': Lane('export', int(os.environ.get('EXPORT_MAX_IN_FLIGHT', 2)), int(os.environ.get('EXPORT_MAX_QUEUE', 4)),
+                   QUEUE_TIMEOUT),
+}
+ADMISSION_ROUTES = {'/predict': 'query', '/api/predict': 'query', '/api/trends': 'query', '/api/simulate': 'query',
+                    '/download': 'export', '/api/export': 'export'}
+app.wsgi_app = AdmissionControl(app.wsgi_app, ADMISSION_LANES, ADMISSION_ROUTES)
+
+# Each user's recent results, kept in memory for /download
+result_store = ResultStore()
+
+# Pre-rendered pages for the engine being served, rebuilt after a snapshot swap
+pages = EnginePages(live.engine, index_template, RESULT_COLUMNS)
+
+def current_pages():
+    global pages
+    engine = live.engine
+    if pages.engine is not engine:
+        pages = EnginePages(engine, index_template, RESULT_COLUMNS)
+    return pages
 
 # Verify data
-logger.debug(f"Columns: {data.columns.tolist()}")
-logger.debug(f"Unique Years: {data['Year'].unique()}")
-logger.debug(f"Unique Seat Types: {data['Seat Type'].unique()}")
-logger.debug(f"Unique Categories: {data['Category'].unique()}")
-logger.debug(f"Unique Programs: {data['Program'].unique()}")
-logger.debug(f"Unique Streams: {data['Stream'].unique()}")
+if logger.isEnabledFor(logging.DEBUG):
+    table = live.engine.table
+    logger.debug(f"Columns: {table.names}")
+    logger.debug(f"Unique Years: {table.unique('Year')}")
+    logger.debug(f"Unique Seat Types: {table.unique('Seat Type')}")
+    logger.debug(f"Unique Categories: {table.unique('Category')}")
+    logger.debug(f"Unique Programs: {table.unique('Program')}")
+    logger.debug(f"Unique Streams: {table.unique('Stream')}")
 
 # Initialize Firebase Admin SDK with environment variable
 if not firebase_admin._apps:
@@ -223,6 +241,10 @@ if not firebase_admin._apps:
         raise ValueError("FIREBASE_CONFIG environment variable not set")
     firebase_admin.initialize_app(cred)
 
+# Verified tokens are cached until they expire; signing keys refresh in the background
+token_verifier = TokenVerifier(firebase_admin.get_app().project_id)
+token_verifier.keys.ensure_started()
+
 # Email validation function (only Gmail addresses)
 def is_valid_gmail(email):
     gmail_pattern = r'^[a-zA-Z0-9._%+-]+@gmail\.com$'
@@ -237,162 +259,277 @@ def verify_token():
     try:
         if id_token.startswith('Bearer '):
             id_token = id_token.split(' ')[1]
-        decoded_token = auth.verify_id_token(id_token)
+        with STAGE_SECONDS.time('auth'):
+            decoded_token = token_verifier.verify(id_token)
         return decoded_token
     except Exception as e:
         logger.error(f"Token verification failed: {str(e)}")
         abort(401, description=f"Unauthorized: Invalid token - {str(e)}")
 
+# Parse one JSON API query. Filter fields must be strings (year may also be a number),
+# so a list or object is rejected here instead of failing the category lookup.
+# Raises ValueError for a malformed query.
+def parse_api_query(item):
+    for field in FILTER_COLUMNS:
+        value = item.get(field, 'Any')
+        if not isinstance(value, str) and not (field == 'year' and isinstance(value, int)):
+            raise ValueError(f'{field} must be a string')
+    return Query.from_form(item)
+
+# Page number and page size of a JSON API request, both at least 1
+def parse_api_page(item):
+    page = int(item.get('page', 1))
+    per_page = min(int(item.get('per_page', 20)), MAX_API_PAGE_SIZE)
+    if page < 1 or per_page < 1:
+        raise ValueError('page and per_page must be at least 1')
+    return page, per_page
+
+@app.before_request
+def refresh_dataset():
+    g.request_start = time.perf_counter()
+    if live.refresh():
+        # Free results for the previous table; any a request still on it stores later
+        # are tagged with its snapshot and never served against the new one
+        result_store.clear()
+
+@app.after_request
+def record_request_time(response):
+    if request.endpoint and 'request_start' in g:
+        REQUEST_SECONDS.observe(request.endpoint, time.perf_counter() - g.request_start)
+    return response
+
+# The blank form is served pre-rendered; links that prefill the form render it
+def index_page():
+    if not request.args:
+        return current_pages().index.response(request)
+    form_data = {k: urllib.parse.unquote(v) for k, v in request.args.items()}
+    return index_template.render(form_data=form_data, **live.engine.options)
+
 @app.route('/')
 def home():
-    programs = sorted([x for x in data['Program'].unique() if pd.notna(x) and x != 'Unknown'])
-    streams = sorted([x for x in data['Stream'].unique() if pd.notna(x) and x != 'Unknown'])
-    categories = sorted([x for x in data['Category'].unique() if pd.notna(x) and x != 'Unknown'])
-    quotas = sorted([x for x in data['Quota'].unique() if pd.notna(x)])
-    seat_types = sorted([x for x in data['Seat Type'].unique() if pd.notna(x) and x != 'Unknown'])
-    rounds = sorted([x for x in data['Round'].unique() if pd.notna(x)])
-    years = sorted([x for x in data['Year'].unique() if x != 0])
-    form_data = {k: urllib.parse.unquote(v) for k, v in request.args.items()}
-    return render_template_string(INDEX_HTML, programs=programs, streams=streams, categories=categories,
-                                 quotas=quotas, seat_types=seat_types, rounds=rounds, years=years, form_data=form_data)
+    return index_page()
 
 @app.route('/predictor')
 def predictor():
-    programs = sorted([x for x in data['Program'].unique() if pd.notna(x) and x != 'Unknown'])
-    streams = sorted([x for x in data['Stream'].unique() if pd.notna(x) and x != 'Unknown'])
-    categories = sorted([x for x in data['Category'].unique() if pd.notna(x) and x != 'Unknown'])
-    quotas = sorted([x for x in data['Quota'].unique() if pd.notna(x)])
-    seat_types = sorted([x for x in data['Seat Type'].unique() if pd.notna(x) and x != 'Unknown'])
-    rounds = sorted([x for x in data['Round'].unique() if pd.notna(x)])
-    years = sorted([x for x in data['Year'].unique() if x != 0])
-    form_data = {k: urllib.parse.unquote(v) for k, v in request.args.items()}
-    return render_template_string(INDEX_HTML, programs=programs, streams=streams, categories=categories,
-                                 quotas=quotas, seat_types=seat_types, rounds=rounds, years=years, form_data=form_data)
+    return index_page()
 
 @app.route('/predict', methods=['POST', 'GET'])
 def predict():
     try:
         decoded_token = verify_token()
-        logger.debug(f"Authenticated user: {decoded_token.get('email')}")
+        logger.debug("Authenticated user: %s", decoded_token.get('email'))
         if request.method == 'POST':
             form_data = request.form.to_dict()
         else:
             form_data = {k: urllib.parse.unquote(v) for k, v in request.args.items()}
-        rank = int(form_data.get('rank', 0))
-        program = form_data.get('program', 'Any')
-        stream = form_data.get('stream', 'Any')
-        category = form_data.get('category', 'Any')
-        quota = form_data.get('quota', 'Any')
-        seat_type = form_data.get('seat_type', 'Any')
-        round = form_data.get('round', 'Any')
-        year = form_data.get('year', 'Any')
-        logger.debug(f"Input: rank={rank}, program={program}, stream={stream}, category={category}, quota={quota}, seat_type={seat_type}, round={round}, year={year}")
+        engine_pages = current_pages()
+        engine = engine_pages.engine
+        query = Query.from_form(form_data)
+        logger.debug("Input: %s", query)
         page = int(form_data.get('page', 1))
         per_page = 20
-        filtered_data = data.copy()
-        low_rank_message = None
-        min_rank_message = None
-        temp_data = filtered_data.copy()
-        if program != 'Any':
-            logger.debug(f"Applying program filter: {program}")
-            temp_data = temp_data[temp_data['Program'] == program]
-            logger.debug(f"After program filter, rows: {len(temp_data)}")
-        if stream != 'Any':
-            logger.debug(f"Applying stream filter: {stream}")
-            temp_data = temp_data[temp_data['Stream'] == stream]
-            logger.debug(f"After stream filter, rows: {len(temp_data)}")
-        if category != 'Any':
-            logger.debug(f"Applying category filter: {category}")
-            temp_data = temp_data[temp_data['Category'] == category]
-            logger.debug(f"After category filter, rows: {len(temp_data)}")
-        if quota != 'Any':
-            logger.debug(f"Applying quota filter: {quota}")
-            temp_data = temp_data[temp_data['Quota'] == quota]
-            logger.debug(f"After quota filter, rows: {len(temp_data)}")
-        if seat_type != 'Any':
-            logger.debug(f"Applying seat_type filter: {seat_type}")
-            temp_data = temp_data[temp_data['Seat Type'] == seat_type]
-            logger.debug(f"After seat_type filter, rows: {len(temp_data)}")
-        if round != 'Any':
-            logger.debug(f"Applying round filter: {round}")
-            temp_data = temp_data[temp_data['Round'] == round]
-            logger.debug(f"After round filter, rows: {len(temp_data)}")
-        if year != 'Any':
-            logger.debug(f"Applying year filter: {year}")
-            temp_data = temp_data[temp_data['Year'] == int(year)]
-            logger.debug(f"After year filter, rows: {len(temp_data)}")
-        if temp_data.empty or 'Opening Rank' not in temp_data.columns:
-            min_rank_message = "No colleges found for these filters. Try relaxing filters like Stream, Program, Category, or Year."
-            if stream != 'Any':
-                logger.debug(f"Retrying without stream filter: {stream}")
-                temp_data = filtered_data.copy()
-                if program != 'Any':
-                    temp_data = temp_data[temp_data['Program'] == program]
-                if category != 'Any':
-                    temp_data = temp_data[temp_data['Category'] == category]
-                if quota != 'Any':
-                    temp_data = temp_data[temp_data['Quota'] == quota]
-                if seat_type != 'Any':
-                    temp_data = temp_data[temp_data['Seat Type'] == seat_type]
-                if round != 'Any':
-                    temp_data = temp_data[temp_data['Round'] == round]
-                if year != 'Any':
-                    temp_data = temp_data[temp_data['Year'] == int(year)]
-                min_rank_message += f" Showing results without Stream filter."
-            filtered_data = pd.DataFrame(columns=data.columns) if temp_data.empty else temp_data
-            logger.debug("No results after applying filters or missing 'Opening Rank' column")
-        else:
-            min_opening_rank = temp_data['Opening Rank'].min()
-            max_opening_rank = temp_data['Opening Rank'].max()
-            logger.debug(f"Min opening rank: {min_opening_rank}, Max opening rank: {max_opening_rank}")
-            filtered_data = temp_data[
-                (temp_data['Opening Rank'] <= rank) &
-                (temp_data['Closing Rank'] >= rank)
-            ]
-            if filtered_data.empty:
-                min_rank_message = f"No colleges found for rank {rank}. Showing colleges with opening ranks above or below your rank."
-                filtered_data = temp_data.copy()
-                filtered_data['Rank_Diff'] = abs(filtered_data['Opening Rank'] - rank)
-                filtered_data = filtered_data.sort_values('Rank_Diff').drop(columns=['Rank_Diff'])
-                logger.debug(f"Showing {len(filtered_data)} colleges with ranks above/below")
-        if not filtered_data.empty and not min_rank_message and len(filtered_data) < 10:
-            low_rank_message = f"Showing additional colleges to provide more options."
-            filtered_data = temp_data.copy()
-            filtered_data['Rank_Diff'] = abs(filtered_data['Opening Rank'] - rank)
-            filtered_data = filtered_data.sort_values('Rank_Diff').drop(columns=['Rank_Diff'])
-            logger.debug(f"Expanded results, rows: {len(filtered_data)}")
-        if min_rank_message or low_rank_message:
-            filtered_data = filtered_data.sort_values('Opening Rank')
-        else:
-            filtered_data = filtered_data.sort_values('Closing Rank')
-        results_file_path = 'results.csv'  # Local relative path
-        if os.environ.get('RENDER', 'False') == 'True':
-            results_file_path = '/app/data/results.csv'  # Render disk path
-        filtered_data.to_csv(results_file_path, index=False)
-        total_results = len(filtered_data)
+        prediction = engine.predict(query)
+        result_store.put(decoded_token.get('uid'), query, prediction, engine.table.path)
+        logger.debug("Matched rows: %d", len(prediction.rows))
+        low_rank_message = prediction.low_rank_message
+        min_rank_message = prediction.min_rank_message
+        total_results = len(prediction.rows)
         start = (page - 1) * per_page
         end = start + per_page
-        paginated_results = filtered_data.iloc[start:end][['Institute', 'Program', 'Round', 'Category', 'Quota', 'Seat Type', 'Opening Rank', 'Closing Rank', 'Year']].to_dict('records')
         has_next = end < total_results
-        return render_template_string(RESULTS_HTML, results=paginated_results, rank=rank, page=page, has_next=has_next,
-                                     total_results=total_results, form_data=form_data, low_rank_message=low_rank_message,
-                                     min_rank_message=min_rank_message)
+        with STAGE_SECONDS.time('render'):
+            rows = engine_pages.rows.render(prediction.rows[start:end])
+            return results_template.render(rows=rows, rank=query.rank, page=page, has_next=has_next,
+                                           total_results=total_results, form_data=form_data, low_rank_message=low_rank_message,
+                                           min_rank_message=min_rank_message)
     except Exception as e:
         logger.error(f"Error in predict: {str(e)}")
         abort(500, description=f"Error: {str(e)}")
 
+# JSON prediction API. Accepts one query object, or {"queries": [...]} with up to
+# MAX_BATCH_QUERIES queries evaluated together. Each query takes the form fields
+# (rank, program, stream, category, quota, seat_type, round, year) plus optional
+# page and per_page.
+@app.route('/api/predict', methods=['POST'])
+def api_predict():
+    decoded_token = verify_token()
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return {'error': 'Request body must be a JSON object'}, 400
+    batch = 'queries' in payload
+    items = payload['queries'] if batch else [payload]
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        return {'error': 'queries must be a non-empty list of objects'}, 400
+    if len(items) > MAX_BATCH_QUERIES:
+        return {'error': f'At most {MAX_BATCH_QUERIES} queries per request'}, 400
+    try:
+        queries = [parse_api_query(item) for item in items]
+        page_specs = [parse_api_page(item) for item in items]
+    except (TypeError, ValueError) as e:
+        return {'error': f'Invalid query: {str(e)}'}, 400
+    try:
+        engine = live.engine
+        predictions = engine.predict_many(queries)
+        render_start = time.perf_counter()
+        results = []
+        for query, prediction, (page, per_page) in zip(queries, predictions, page_specs):
+            start = (page - 1) * per_page
+            results.append({
+                'query': query._asdict(),
+                'total_results': len(prediction.rows),
+                'page': page,
+                'has_next': start + per_page < len(prediction.rows),
+                'min_rank_message': prediction.min_rank_message,
+                'low_rank_message': prediction.low_rank_message,
+                'results': engine.frame(prediction.rows[start:start + per_page])[RESULT_COLUMNS].to_dict('records'),
+            })
+        STAGE_SECONDS.observe('render', time.perf_counter() - render_start)
+        if not batch:
+            result_store.put(decoded_token.get('uid'), queries[0], predictions[0], engine.table.path)
+            return results[0]
+        return {'results': results}
+    except Exception as e:
+        logger.error(f"Error in api_predict: {str(e)}")
+        abort(500, description=f"Error: {str(e)}")
+
+# Multi-year view for one rank: every seat matching the filters, with its closing
+# ranks by year, a trend-adjusted expected closing rank for the coming year and the
+# likelihood of admission at that rank, most likely first. Takes rank and the program,
+# category, quota, seat_type and round filters (stream and year do not apply), plus
+# optional min_likelihood, page and per_page. Only WBJEE seats are scored unless
+# seat_type names another pool, since JEE(Main) seats close on a different rank scale.
+@app.route('/api/trends', methods=['POST'])
+def api_trends():
+    verify_token()
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return {'error': 'Request body must be a JSON object'}, 400
+    try:
+        query = parse_api_query(payload)
+        min_likelihood = float(payload.get('min_likelihood', 0))
+        page, per_page = parse_api_page(payload)
+    except (TypeError, ValueError) as e:
+        return {'error': f'Invalid query: {str(e)}'}, 400
+    try:
+        trends = live.engine.trends
+        scores = trends.score(query.rank, query.filters(), min_likelihood)
+        start = (page - 1) * per_page
+        with STAGE_SECONDS.time('render'):
+            results = trends.records(scores.keys[start:start + per_page], scores.likelihood[start:start + per_page])
+        return {
+            'query': query._asdict(),
+            'target_year': scores.target_year,
+            'total_results': len(scores.keys),
+            'page': page,
+            'has_next': start + per_page < len(scores.keys),
+            'results': results,
+        }
+    except Exception as e:
+        logger.error(f"Error in api_trends: {str(e)}")
+        abort(500, description=f"Error: {str(e)}")
+
+# Round-by-round allotment simulation. Accepts one student, or {"students": [...]}
+# with up to MAX_BATCH_QUERIES students. A student has rank, preferences (an ordered
+# list of {"institute", "program"}) and optional category, quota, seat_type and id.
+# seat_type defaults to WBJEE seats, the pool a WBJEE rank applies to. Larger lists
+# are run offline with `python simulate.py`.
+@app.route('/api/simulate', methods=['POST'])
+def api_simulate():
+    verify_token()
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return {'error': 'Request body must be a JSON object'}, 400
+    batch = 'students' in payload
+    students = payload['students'] if batch else [payload]
+    if not isinstance(students, list) or not students:
+        return {'error': 'students must be a non-empty list of objects'}, 400
+    if len(students) > MAX_BATCH_QUERIES:
+        return {'error': f'At most {MAX_BATCH_QUERIES} students per request'}, 400
+    simulator = live.engine.simulator
+    try:
+        with STAGE_SECONDS.time('simulate'):
+            results = [simulator.simulate_student(student) for student in students]
+    except (TypeError, ValueError) as e:
+        return {'error': f'Invalid student: {str(e)}'}, 400
+    return {'results': results} if batch else results[0]
+
+# Stream result rows as CSV or NDJSON, gzip-compressed when the client accepts it
+def export_response(engine, rows, fmt):
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    chunks = iter_export(engine.table, rows, fmt)
+    headers = {'Content-Disposition': f'attachment; filename=college_results.{extension}', 'Vary': 'Accept-Encoding'}
+    if request.accept_encodings['gzip'] > 0:
+        chunks = iter_gzip(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(timed_chunks(chunks, STAGE_SECONDS, 'export'), mimetype=mimetype, headers=headers)
+
 @app.route('/download')
 def download():
     try:
-        verify_token()
-        results_file_path = 'results.csv'  # Local relative path
-        if os.environ.get('RENDER', 'False') == 'True':
-            results_file_path = '/app/data/results.csv'  # Render disk path
-        return send_file(results_file_path, as_attachment=True, download_name='college_results.csv')
+        decoded_token = verify_token()
+        user = decoded_token.get('uid')
+        engine = live.engine
+        fmt = request.args.get('format', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported format {fmt}")
+        if 'rank' in request.args:
+            form_data = {k: urllib.parse.unquote(v) for k, v in request.args.items()}
+            query = Query.from_form(form_data)
+            prediction = result_store.get(user, query, engine.table.path)
+        else:
+            # Links without a query download the user's most recent prediction
+            query, prediction = result_store.latest(user, engine.table.path)
+            if query is None:
+                raise LookupError("Run a prediction first.")
+        if prediction is None:
+            prediction = engine.predict(query)
+            result_store.put(user, query, prediction, engine.table.path)
+        return export_response(engine, prediction.rows, fmt)
     except Exception as e:
         logger.error(f"Error in download: {str(e)}")
         abort(500, description=f"Error: No results to download. {str(e)}")
 
+# Full result set for one query, streamed as NDJSON (default) or CSV via format.
+# Takes the same fields as /api/predict, as a JSON body or query parameters.
+@app.route('/api/export', methods=['GET', 'POST'])
+def api_export():
+    verify_token()
+    payload = request.get_json(silent=True) if request.method == 'POST' else request.args.to_dict()
+    if not isinstance(payload, dict):
+        return {'error': 'Request body must be a JSON object'}, 400
+    fmt = payload.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return {'error': f'format must be one of {", ".join(EXPORT_FORMATS)}'}, 400
+    try:
+        query = parse_api_query(payload)
+    except (TypeError, ValueError) as e:
+        return {'error': f'Invalid query: {str(e)}'}, 400
+    engine = live.engine
+    return export_response(engine, engine.predict(query).rows, fmt)
+
+# Prometheus scrape endpoint. Counts are per gunicorn worker; each scrape is
+# answered by whichever worker takes the request.
+@app.route('/metrics')
+def metrics():
+    engine = live.engine
+    caches = dict(engine.cache_stats(), tokens=token_verifier.cache.stats(), user_results=result_store.results.stats())
+    values = {
+        f'predictor_cache_{key}_total': ('counter', f'Cache {key} by cache.', {name: stats[key] for name, stats in caches.items()})
+        for key in ('hits', 'misses', 'evictions')
+    }
+    values['predictor_cache_entries'] = ('gauge', 'Entries held by cache.', {name: stats['entries'] for name, stats in caches.items()})
+    values['predictor_cache_bytes'] = ('gauge', 'Bytes held by cache.', {name: stats['bytes'] for name, stats in caches.items()})
+    lanes = {name: lane.stats() for name, lane in ADMISSION_LANES.items()}
+    admission = {
+        'predictor_admitted_total': ('counter', 'Requests admitted by lane.', {name: stats['admitted'] for name, stats in lanes.items()}),
+        'predictor_shed_total': ('counter', 'Requests turned away with 503 by lane.', {name: stats['shed'] for name, stats in lanes.items()}),
+        'predictor_in_flight': ('gauge', 'Requests running by lane.', {name: stats['in_flight'] for name, stats in lanes.items()}),
+        'predictor_queue_depth': ('gauge', 'Requests waiting for a slot by lane.', {name: stats['waiting'] for name, stats in lanes.items()}),
+    }
+    body = '\n'.join([STAGE_SECONDS.render(), REQUEST_SECONDS.render(), render_values(values, 'cache'),
+                      render_values(admission, 'lane')]) + '\n'
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 @app.route('/favicon.ico')
 def favicon():
     try:
@@ -0,0 +1,51 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from dataset import load_dataset
+from engine import Query, QueryEngine
+
+
+# A counsellor's batch: every student's rank against a few filter combinations
+def class_queries(table, students, seed=0):
+    rng = random.Random(seed)
+    ranks = [rng.randint(1, 120000) for _ in range(students)]
+    combos = [{'category': 'Open', 'round': 'Round 1', 'year': 2024},
+              {'category': 'Open', 'quota': 'Home State'},
+              {}]
+    combos += [{'category': category} for category in table.unique('Category')]
+    return [Query.from_form(dict(combo, rank=rank)) for rank in ranks for combo in combos]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare batch prediction with one query at a time.')
+    parser.add_argument('--students', type=int, default=300)
+    args = parser.parse_args()
+
+    engine = QueryEngine(load_dataset())
+    queries = class_queries(engine.table, args.students)
+    # Build the partition indexes up front; both runs then pay for the rank stage only
+    engine.predict_many(queries)
+    engine.results.clear()
+
+    start = time.perf_counter()
+    single = [engine.predict(query) for query in queries]
+    single_time = time.perf_counter() - start
+
+    engine.results.clear()
+    start = time.perf_counter()
+    batch = engine.predict_many(queries)
+    batch_time = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(single, batch) if not (np.array_equal(a.rows, b.rows) and a[1:] == b[1:]))
+    print(f"queries: {len(queries)}")
+    print(f"one at a time: {single_time * 1000:8.1f} ms")
+    print(f"predict_many:  {batch_time * 1000:8.1f} ms  ({single_time / batch_time:.1f}x)")
+    print(f"mismatches: {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,46 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# Each run happens in a fresh interpreter so imports and file reads are measured
+# the way a newly forked gunicorn worker would pay for them
+WORKER_BOOT = """
+import json, time
+start = time.perf_counter()
+from dataset import load_dataset, load_table
+from engine import QueryEngine
+loaded = time.perf_counter()
+engine = QueryEngine({loader})
+done = time.perf_counter()
+print(json.dumps({{'imports': loaded - start, 'data': done - loaded, 'total': done - start}}))
+"""
+
+
+def boot(loader):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', WORKER_BOOT.format(loader=loader)],
+                            check=True, capture_output=True, text=True).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings['process'] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure worker cold-start time from CSV and from the snapshot.')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    # Make sure the snapshot exists before timing the snapshot path
+    boot('load_dataset()')
+    for label, loader in [('csv + normalize', 'load_table()[0]'), ('snapshot', 'load_dataset()')]:
+        runs = [boot(loader) for _ in range(args.runs)]
+        summary = {key: statistics.median(run[key] for run in runs) * 1000 for key in runs[0]}
+        print(f"{label:16s} data+index: {summary['data']:7.1f} ms  imports: {summary['imports']:7.1f} ms  "
+              f"process: {summary['process']:7.1f} ms  (median of {args.runs})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from dataset import Table, load_dataset
+from engine import FILTER_COLUMNS, Query, QueryEngine
+from benchmarks.reference import legacy_predict, same_result
+
+
+# Random /predict form submissions: each filter is 'Any' or a value seen in the table
+def sample_queries(data, count, any_probability=0.5, seed=0):
+    rng = random.Random(seed)
+    values = {field: sorted(data[col].unique().tolist()) for field, col in FILTER_COLUMNS.items()}
+    ranks = data['Closing Rank'].tolist()
+    queries = []
+    for _ in range(count):
+        form_data = {'rank': str(rng.choice(ranks) + rng.randint(-500, 500))}
+        for field, options in values.items():
+            form_data[field] = 'Any' if rng.random() < any_probability else str(rng.choice(options))
+        queries.append(form_data)
+    return queries
+
+
+# The table with some rank cells blanked out, as a CSV with empty rank cells loads
+def with_missing_ranks(table, every=37):
+    columns = dict(table.columns)
+    for offset, col in enumerate(['Opening Rank', 'Closing Rank']):
+        values = columns[col].astype(np.float64)
+        values[offset::every] = np.nan
+        columns[col] = values
+    return Table(columns, table.categories)
+
+
+# Queries whose engine result differs from the mask chain's
+def mismatched(table, queries):
+    data = table.to_frame()
+    engine = QueryEngine(table)
+    return [form_data for form_data in queries
+            if not same_result(data, legacy_predict(data, form_data), engine.predict(Query.from_form(form_data)))]
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    for form_data in queries:
+        fn(form_data)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the query engine with the legacy mask chain.')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--any-probability', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    table = load_dataset()
+    data = table.to_frame()
+    start = time.perf_counter()
+    engine = QueryEngine(table)
+    build_time = time.perf_counter() - start
+    queries = sample_queries(data, args.queries, args.any_probability, args.seed)
+
+    mismatches = [form_data for form_data in queries
+                  if not same_result(data, legacy_predict(data, form_data), engine.predict(Query.from_form(form_data)))]
+    mismatches += mismatched(with_missing_ranks(table), queries)
+
+    # The correctness pass above has already built the partition rank indexes;
+    # drop the finished predictions so the first engine run measures the rank stage
+    legacy_time = timed(lambda form_data: legacy_predict(data, form_data), queries)
+    engine.results.clear()
+    engine_time = timed(lambda form_data: engine.predict(Query.from_form(form_data)), queries)
+    cached_time = timed(lambda form_data: engine.predict(Query.from_form(form_data)), queries)
+    print(f"rows: {len(data)}  queries: {len(queries)}  engine build: {build_time * 1000:.1f} ms")
+    print(f"legacy mask chain: {legacy_time / len(queries) * 1e6:9.1f} us/query")
+    print(f"query engine:      {engine_time / len(queries) * 1e6:9.1f} us/query  ({legacy_time / engine_time:.1f}x)")
+    print(f"result cache hit:  {cached_time / len(queries) * 1e6:9.1f} us/query  ({legacy_time / cached_time:.1f}x)")
+    print(f"cache stats: {engine.cache_stats()}")
+    print(f"mismatches: {len(mismatches)}")
+    for form_data in mismatches[:5]:
+        print(f"  {form_data}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
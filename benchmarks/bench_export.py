@@ -0,0 +1,64 @@
+import argparse
+import json
+import subprocess
+import sys
+
+# Each mode runs in a fresh interpreter so ru_maxrss reflects that export alone.
+# The table is tiled `scale` times to stand in for more years of data.
+EXPORT_RUN = """
+import json, resource, time
+import numpy as np
+from dataset import Table, load_dataset
+from engine import Query, QueryEngine
+from export import iter_export, iter_gzip
+
+table = load_dataset()
+table = Table({{col: np.tile(values, {scale}) for col, values in table.columns.items()}}, table.categories)
+engine = QueryEngine(table)
+rows = engine.predict(Query.from_form({{'rank': 0}})).rows  # every row, widened results
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+start = time.perf_counter()
+if '{mode}' == 'legacy':
+    # Previous behaviour: serialize the whole result, then send it
+    chunks = iter([table.take(rows).to_csv(index=False)])
+else:
+    fmt, _, compress = '{mode}'.partition('+')
+    chunks = iter_export(table, rows, fmt)
+    if compress:
+        chunks = iter_gzip(chunks)
+first_byte = None
+size = 0
+for chunk in chunks:
+    if first_byte is None:
+        first_byte = time.perf_counter() - start
+    size += len(chunk)
+total = time.perf_counter() - start
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'rows': len(rows), 'ttfb': first_byte, 'total': total, 'bytes': size,
+                  'peak_rss_delta_kb': after - before}}))
+"""
+
+MODES = ['legacy', 'csv', 'csv+gzip', 'ndjson', 'ndjson+gzip']
+
+
+def run(mode, scale):
+    output = subprocess.run([sys.executable, '-c', EXPORT_RUN.format(mode=mode, scale=scale)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure time-to-first-byte and peak RSS of a full-dataset export.')
+    parser.add_argument('--scale', type=int, default=10, help='tile the dataset this many times')
+    args = parser.parse_args()
+
+    for mode in MODES:
+        result = run(mode, args.scale)
+        print(f"{mode:12s} rows: {result['rows']:8d}  ttfb: {result['ttfb'] * 1000:8.1f} ms  "
+              f"total: {result['total'] * 1000:8.1f} ms  size: {result['bytes'] / 1e6:7.1f} MB  "
+              f"peak RSS growth: {result['peak_rss_delta_kb'] / 1024:7.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataset import DATA_FILE_PATH, append_snapshot, build_snapshot, load_table
+from benchmarks.reference import legacy_load_data
+
+
+def best_of(runs, fn):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+# Same rows, in the same order, with the same decoded values
+def same_frame(a, b):
+    if list(a.columns) != list(b.columns) or len(a) != len(b):
+        return False
+    return all(a[col].astype(str).tolist() == b[col].astype(str).tolist()
+               for col in a.columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare CSV normalization and incremental year ingestion with a full rebuild.')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    parse_time, _ = best_of(args.runs, lambda: pd.read_csv(DATA_FILE_PATH))
+    legacy_time, legacy = best_of(args.runs, lambda: legacy_load_data(DATA_FILE_PATH))
+    table_time, (table, hashes) = best_of(args.runs, lambda: load_table(DATA_FILE_PATH))
+    print(f"rows: {len(table)}  (CSV parse alone: {parse_time * 1000:.1f} ms, included below)")
+    print(f"legacy normalize:       {legacy_time * 1000:8.1f} ms")
+    print(f"per-value normalize:    {table_time * 1000:8.1f} ms  ({legacy_time / table_time:.1f}x)")
+    mismatches = 0 if same_frame(legacy, table.to_frame()) else 1
+
+    # Split off the latest year, publish the rest, then append the latest year to it
+    data = pd.read_csv(DATA_FILE_PATH)
+    latest = data['Year'].max()
+    work_dir = tempfile.mkdtemp()
+    try:
+        base_csv = os.path.join(work_dir, 'base.csv')
+        new_csv = os.path.join(work_dir, 'new.csv')
+        data[data['Year'] != latest].to_csv(base_csv, index=False)
+        data[data['Year'] == latest].to_csv(new_csv, index=False)
+        snapshot_dir = os.path.join(work_dir, 'snapshot')
+
+        build_snapshot(base_csv, snapshot_dir)
+        start = time.perf_counter()
+        _, appended, added = append_snapshot(new_csv, snapshot_dir)
+        append_time = time.perf_counter() - start
+        # Appending the same rows again adds nothing
+        _, _, added_again = append_snapshot(new_csv, snapshot_dir)
+
+        start = time.perf_counter()
+        build_snapshot(DATA_FILE_PATH, os.path.join(work_dir, 'full'))
+        rebuild_time = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work_dir)
+
+    print(f"append {latest} ({added} rows): {append_time * 1000:8.1f} ms")
+    print(f"full rebuild:           {rebuild_time * 1000:8.1f} ms")
+    if not same_frame(legacy, appended.to_frame()) or added_again:
+        mismatches += 1
+    if not np.array_equal(np.sort(hashes), np.sort(np.unique(hashes))):
+        mismatches += 1
+    print(f"mismatches: {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
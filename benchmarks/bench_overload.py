@@ -0,0 +1,139 @@
+import argparse
+import http.client
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+
+PROJECT_ID = 'bench-project'
+
+# Each mode runs gunicorn with gunicorn.conf.py and these overrides. 'unbounded' lifts
+# the admission limits, so every connection the thread pool accepts runs at once.
+MODES = {
+    'unbounded': {'QUERY_MAX_IN_FLIGHT': '1000', 'EXPORT_MAX_IN_FLIGHT': '1000', 'GUNICORN_THREADS': '128'},
+    'admission': {},
+}
+
+
+# gunicorn entry point: the real app, with tokens checked against a local signer.
+# A token for the clients is written to BENCH_TOKEN_FILE.
+def serving_app():
+    import logging
+    import app as predictor_app
+    from tokens import FakeTokenSigner, PublicKeyCache, TokenVerifier
+    logging.getLogger('tokens').setLevel(logging.CRITICAL)
+    signer = FakeTokenSigner(PROJECT_ID)
+    predictor_app.token_verifier = TokenVerifier(PROJECT_ID, PublicKeyCache(signer.fetch_keys))
+    with open(os.environ['BENCH_TOKEN_FILE'], 'w') as f:
+        f.write(signer.sign('bench-user', 'bench@gmail.com'))
+    return predictor_app.app
+
+
+def start_server(mode, port, token_file):
+    from benchmarks.harness import fake_firebase_config
+    env = dict(os.environ, FIREBASE_CONFIG=fake_firebase_config(PROJECT_ID), BENCH_TOKEN_FILE=token_file,
+               LOG_LEVEL='WARNING', **MODES[mode])
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--workers', '1', '--bind', f'127.0.0.1:{port}',
+                               '--log-level', 'warning', 'benchmarks.bench_overload:serving_app()'], env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if os.path.getsize(token_file):
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                connection.request('GET', '/metrics')
+                connection.getresponse().read()
+                return server
+            except OSError:
+                pass
+        time.sleep(0.2)
+    server.kill()
+    raise RuntimeError('gunicorn did not start')
+
+
+# Closed-loop client: post a prediction for a fresh rank (a result-cache miss), and
+# on 503 wait briefly before trying again. Every few requests is a full export.
+def client(port, token, stop, seed, export_every, results):
+    rng = random.Random(seed)
+    headers = {'Authorization': 'Bearer ' + token, 'Content-Type': 'application/x-www-form-urlencoded'}
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    count = 0
+    while not stop.is_set():
+        count += 1
+        start = time.perf_counter()
+        try:
+            if export_every and count % export_every == 0:
+                connection.request('GET', '/download?rank=0', headers=headers)
+                kind = 'export'
+            else:
+                body = urllib.parse.urlencode({'rank': rng.randint(1, 120000), 'category': rng.choice(['Open', 'Any'])})
+                connection.request('POST', '/predict', body, headers)
+                kind = 'predict'
+            response = connection.getresponse()
+            response.read()
+        except OSError:
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            results.append(('error', 'error', time.perf_counter() - start))
+            continue
+        elapsed = time.perf_counter() - start
+        results.append((kind, response.status, elapsed))
+        if response.status == 503:
+            time.sleep(0.05)
+    connection.close()
+
+
+def run(mode, port, clients, duration, export_every):
+    with tempfile.NamedTemporaryFile() as token_file:
+        server = start_server(mode, port, token_file.name)
+        try:
+            with open(token_file.name) as f:
+                token = f.read()
+            results = []
+            stop = threading.Event()
+            threads = [threading.Thread(target=client, args=(port, token, stop, i, export_every, results))
+                       for i in range(clients)]
+            for thread in threads:
+                thread.start()
+            time.sleep(duration)
+            stop.set()
+            for thread in threads:
+                thread.join()
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def summary(results, kind):
+    ok = np.array([elapsed for k, status, elapsed in results if k == kind and status == 200]) * 1000
+    shed = sum(1 for k, status, _ in results if k == kind and status == 503)
+    if not len(ok):
+        return f"{kind:8s} no successful requests, {shed} shed"
+    p50, p99 = np.percentile(ok, [50, 99])
+    return f"{kind:8s} ok: {len(ok):6d}  p50 {p50:8.1f} ms  p99 {p99:8.1f} ms  max {ok.max():8.1f} ms  shed (503): {shed}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive gunicorn past capacity with and without admission control.')
+    parser.add_argument('--clients', type=int, default=64, help='concurrent closed-loop clients')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per mode')
+    parser.add_argument('--export-every', type=int, default=20, help='every Nth request of a client is a full export (0 = none)')
+    parser.add_argument('--port', type=int, default=5123)
+    args = parser.parse_args()
+
+    for mode in MODES:
+        results = run(mode, args.port, args.clients, args.duration, args.export_every)
+        errors = sum(1 for kind, _, _ in results if kind == 'error')
+        print(f"{mode}: {args.clients} clients for {args.duration:.0f} s, connection errors: {errors}")
+        print(f"  {summary(results, 'predict')}")
+        print(f"  {summary(results, 'export')}")
+
+
+if __name__ == '__main__':
+    main()
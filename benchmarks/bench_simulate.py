@@ -0,0 +1,101 @@
+import argparse
+import math
+import random
+import time
+
+from dataset import current_snapshot, load_dataset
+from engine import Query, QueryEngine
+from simulate import simulate_batch
+from trends import DEFAULT_SEAT_TYPE, UNRECORDED_SEAT_TYPE
+
+
+# A coaching institute's students: a log-normal rank, a category and quota, and 5-20
+# (institute, program) preferences drawn from table rows, so popular seats come up more
+def make_students(table, count, seed=0):
+    rng = random.Random(seed)
+    data = table.to_frame()
+    seats = list(zip(data['Institute'].astype(str), data['Program'].astype(str)))
+    categories = data['Category'].astype(str).tolist()
+    students = []
+    for i in range(count):
+        rank = min(max(int(rng.lognormvariate(math.log(30000), 1.2)), 1), 150000)
+        preferences = []
+        for _ in range(rng.randint(5, 20)):
+            institute, program = rng.choice(seats)
+            if {'institute': institute, 'program': program} not in preferences:
+                preferences.append({'institute': institute, 'program': program})
+        student = {'id': i, 'rank': rank, 'category': rng.choice(categories), 'preferences': preferences}
+        if rng.random() < 0.5:
+            student['quota'] = rng.choice(['Home State', 'All India'])
+        students.append(student)
+    return students
+
+
+# The same walk done row by row on the DataFrame over WBJEE seats, for checking the simulator
+def reference_allotments(data, student):
+    data = data[(data['Category'] == student['category']) & (data['Seat Type'] == DEFAULT_SEAT_TYPE)]
+    if 'quota' in student:
+        data = data[data['Quota'] == student['quota']]
+    allotments = {}
+    for year in sorted(data['Year'].unique()):
+        rounds = sorted(set(data['Round'][data['Year'] == year]))
+        allotments[int(year)] = None
+        for round_name in rounds:
+            rows = data[(data['Year'] == year) & (data['Round'] == round_name) & (data['Closing Rank'] >= student['rank'])]
+            offered = set(zip(rows['Institute'], rows['Program']))
+            for preference, seat in enumerate(student['preferences'], 1):
+                if (seat['institute'], seat['program']) in offered:
+                    allotments[int(year)] = (round_name, preference)
+                    break
+            if allotments[int(year)] is not None:
+                break
+    return allotments
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the round simulation in-process and in a worker pool.')
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--check', type=int, default=100, help='students compared with the row-by-row walk')
+    args = parser.parse_args()
+
+    table = load_dataset()
+    engine = QueryEngine(table)
+    students = make_students(table, args.students)
+
+    start = time.perf_counter()
+    local = [engine.simulator.simulate_student(student) for student in students]
+    local_time = time.perf_counter() - start
+    start = time.perf_counter()
+    pooled = list(simulate_batch(students, args.workers, current_snapshot()))
+    pool_time = time.perf_counter() - start
+
+    # What a counsellor does by hand: one form query per preference, year and round
+    form_queries = [Query.from_form({'rank': s['rank'], 'category': s['category'], 'year': year, 'round': name,
+                                     'quota': s.get('quota', 'Any')})
+                    for s in students[:50] for year in engine.simulator.years for name in engine.simulator.rounds]
+    start = time.perf_counter()
+    for query in form_queries:
+        engine.predict(query)
+    per_form = (time.perf_counter() - start) / len(form_queries)
+    forms = sum(len(s['preferences']) for s in students) * len(engine.simulator.years) * len(engine.simulator.rounds)
+
+    print(f"students: {len(students)}  preferences: {sum(len(s['preferences']) for s in students)}")
+    print(f"in-process:        {local_time:7.2f} s  ({local_time / len(students) * 1e6:7.1f} us/student)")
+    print(f"pool of {args.workers} (spawn): {pool_time:7.2f} s  including worker start-up")
+    print(f"form queries instead: {forms} x {per_form * 1e6:.0f} us = {forms * per_form:.0f} s of server time alone")
+
+    data = table.to_frame()
+    data['Seat Type'] = data['Seat Type'].astype(str).replace(UNRECORDED_SEAT_TYPE, DEFAULT_SEAT_TYPE)
+    mismatches = sum(1 for a, b in zip(local, pooled) if a != b)
+    for student, result in zip(students[:args.check], local):
+        expected = reference_allotments(data, student)
+        got = {y['year']: y['allotment'] and (y['allotment']['round'], y['allotment']['preference']) for y in result['years']}
+        got = {year: allotment for year, allotment in got.items() if year in expected}
+        mismatches += got != expected
+    print(f"mismatches: {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,62 @@
+import argparse
+import time
+
+from tokens import FakeTokenSigner, InvalidTokenError, PublicKeyCache, TokenVerifier
+
+
+def per_call(fn, count):
+    start = time.perf_counter()
+    for i in range(count):
+        fn(i)
+    return (time.perf_counter() - start) / count
+
+
+# Tokens the verifier must reject, each with a reason
+def rejected_tokens(signer):
+    other = FakeTokenSigner(signer.project_id, kid=signer.kid)
+    return {
+        'expired': signer.sign('u1', lifetime=-10),
+        'wrong audience': FakeTokenSigner('other-project', kid=signer.kid).sign('u1'),
+        'wrong signing key': other.sign('u1'),
+        'unknown key id': FakeTokenSigner(signer.project_id, kid='rotated').sign('u1'),
+        'not a jwt': 'not-a-token',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Firebase ID token verification offline.')
+    parser.add_argument('--tokens', type=int, default=200)
+    parser.add_argument('--requests-per-token', type=int, default=20)
+    args = parser.parse_args()
+
+    signer = FakeTokenSigner()
+    tokens = [signer.sign(f'user-{i}', f'user{i}@gmail.com') for i in range(args.tokens)]
+
+    failures = []
+    for reason, token in rejected_tokens(signer).items():
+        try:
+            TokenVerifier(signer.project_id, PublicKeyCache(signer.fetch_keys)).verify(token)
+            failures.append(reason)
+        except InvalidTokenError:
+            pass
+
+    uncached = TokenVerifier(signer.project_id, PublicKeyCache(signer.fetch_keys), cache_size=0)
+    cached = TokenVerifier(signer.project_id, PublicKeyCache(signer.fetch_keys))
+    cached.verify(tokens[0])  # first key fetch
+    uncached.verify(tokens[0])
+    full_check = per_call(lambda i: uncached.verify(tokens[i % len(tokens)]), args.tokens)
+    calls = args.tokens * args.requests_per_token
+    # Each user clicks through several pages with the same token
+    mixed = per_call(lambda i: cached.verify(tokens[i // args.requests_per_token]), calls)
+    hit = per_call(lambda i: cached.verify(tokens[i % len(tokens)]), calls)
+
+    print(f"signature check:           {full_check * 1e6:8.1f} us/request")
+    print(f"cached, {args.requests_per_token:3d} requests/token: {mixed * 1e6:8.1f} us/request")
+    print(f"cache hit:                 {hit * 1e6:8.1f} us/request")
+    print(f"cache stats: {cached.cache.stats()}")
+    print(f"accepted invalid tokens: {failures or 'none'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,91 @@
+import argparse
+import math
+import time
+
+import numpy as np
+
+from dataset import load_dataset
+from engine import Query, QueryEngine
+from trends import DEFAULT_SEAT_TYPE, SEAT_KEY_COLUMNS, TrendTable
+
+
+# What a client does today: one prediction per year, then line the years up itself
+def per_year_queries(engine, rank, years):
+    series = {}
+    for year in years:
+        prediction = engine.predict(Query.from_form({'rank': rank, 'year': year}))
+        frame = engine.frame(prediction.rows)
+        for record in frame[SEAT_KEY_COLUMNS + ['Closing Rank']].to_dict('records'):
+            key = tuple(record[col] for col in SEAT_KEY_COLUMNS)
+            series.setdefault(key, {})[year] = record['Closing Rank']
+    return series
+
+
+# Fit on every year but the last, predict the last, and compare with what happened.
+# Only WBJEE seats are scored, since that is the pool a WBJEE rank is matched against.
+# Returns (keys, median abs % error of the expected cutoff, same for "last year's
+# cutoff again", Brier score of the likelihood over sampled ranks, calibration bins).
+def backtest(table, samples=20, seed=0):
+    years = np.unique(table.columns['Year'][table.columns['Year'] > 0])
+    full = TrendTable(table)
+    past = TrendTable(table.subset(np.flatnonzero(table.columns['Year'] < years[-1])), target_year=int(years[-1]))
+    index = {key: i for i, key in enumerate(zip(*(full.key_codes[col].tolist() for col in SEAT_KEY_COLUMNS)))}
+    wbjee = past.lookup['Seat Type'].get(DEFAULT_SEAT_TYPE)
+    past_keys, full_keys = [], []
+    for i, key in enumerate(zip(*(past.key_codes[col].tolist() for col in SEAT_KEY_COLUMNS))):
+        if past.key_codes['Seat Type'][i] != wbjee:
+            continue
+        j = index.get(key)
+        if j is not None and not np.isnan(full.closing[j, -1]):
+            past_keys.append(i)
+            full_keys.append(j)
+    past_keys = np.array(past_keys)
+    actual = full.closing[full_keys, -1]
+    last = np.array([row[~np.isnan(row)][-1] for row in past.closing[past_keys]])
+    trend_error = np.median(np.abs(past.expected[past_keys] - actual) / actual)
+    last_error = np.median(np.abs(last - actual) / actual)
+
+    rng = np.random.default_rng(seed)
+    ranks = np.minimum(np.exp(rng.normal(math.log(30000), 1.2, len(past_keys) * samples)), 150000)
+    keys = np.repeat(np.arange(len(past_keys)), samples)
+    likelihood = past.likelihood(ranks, past_keys[keys])
+    admitted = actual[keys] >= ranks
+    brier = np.mean((likelihood - admitted) ** 2)
+    bins = np.digitize(likelihood, [0.1, 0.3, 0.5, 0.7, 0.9])
+    calibration = [(likelihood[bins == b].mean(), admitted[bins == b].mean()) for b in range(6) if np.any(bins == b)]
+    return len(past_keys), trend_error, last_error, brier, calibration
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time trend scoring and backtest its predictions.')
+    parser.add_argument('--ranks', type=int, default=200)
+    args = parser.parse_args()
+
+    table = load_dataset()
+    engine = QueryEngine(table)
+    start = time.perf_counter()
+    trends = TrendTable(table)
+    build_time = time.perf_counter() - start
+    print(f"seat keys: {len(trends)}  years: {trends.years.tolist()}  build: {build_time * 1000:.1f} ms  "
+          f"size: {trends.nbytes / 1024:.0f} KB")
+
+    ranks = np.random.default_rng(0).integers(1, 120000, args.ranks).tolist()
+    start = time.perf_counter()
+    for rank in ranks:
+        trends.score(rank, {})
+    score_time = (time.perf_counter() - start) / len(ranks)
+    start = time.perf_counter()
+    for rank in ranks[:20]:
+        per_year_queries(engine, rank, trends.years.tolist())
+    per_year_time = (time.perf_counter() - start) / 20
+    print(f"score every key for one rank: {score_time * 1e6:8.1f} us")
+    print(f"per-year queries + merge:     {per_year_time * 1e6:8.1f} us  ({per_year_time / score_time:.0f}x)")
+
+    keys, trend_error, last_error, brier, calibration = backtest(table)
+    print(f"backtest on {keys} seats: median abs error {trend_error:.1%} (last year's cutoff: {last_error:.1%})  "
+          f"Brier {brier:.4f}")
+    print("calibration (predicted -> observed): " + "  ".join(f"{p:.2f}->{o:.2f}" for p, o in calibration))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import resource
+import time
+import urllib.parse
+
+import numpy as np
+
+from dataset import load_dataset
+from engine import FILTER_COLUMNS, Query, QueryEngine
+from benchmarks.reference import legacy_predict, same_result
+
+# Chance that a simulated student leaves each filter at 'Any'
+ANY_PROBABILITY = {
+    'program': 0.6,
+    'stream': 0.8,
+    'category': 0.1,
+    'quota': 0.5,
+    'seat_type': 0.7,
+    'round': 0.5,
+    'year': 0.4,
+}
+
+# Share of each request type in the mix; predict requests page deeper at random
+REQUEST_MIX = [('predict', 0.85), ('home', 0.10), ('download', 0.05)]
+# Chance of following a Next link to one more page
+NEXT_PAGE_PROBABILITY = 0.3
+MAX_PAGE = 10
+
+SIMULATED_USERS = 50
+
+
+# Realistic /predict form submissions. Filter values come from a random table row, so
+# combinations that exist are picked in proportion to how common they are. Ranks are
+# log-normal around the typical WBJEE rank, clipped to the table's range.
+def make_form_queries(table, count, seed=0):
+    rng = random.Random(seed)
+    data = {field: table.take(slice(None))[col].astype(str).tolist() for field, col in FILTER_COLUMNS.items()}
+    max_rank = int(table.columns['Closing Rank'].max())
+    queries = []
+    for _ in range(count):
+        row = rng.randrange(len(table))
+        rank = min(max(int(rng.lognormvariate(math.log(30000), 1.2)), 1), max_rank)
+        form_data = {'rank': str(rank)}
+        for field, probability in ANY_PROBABILITY.items():
+            form_data[field] = 'Any' if rng.random() < probability else data[field][row]
+        queries.append(form_data)
+    return queries
+
+
+# The request mix one worker replays: (kind, user, form_data, page)
+def make_requests(form_queries, count, seed=0):
+    rng = random.Random(seed)
+    kinds, weights = zip(*REQUEST_MIX)
+    requests = []
+    while len(requests) < count:
+        kind = rng.choices(kinds, weights)[0]
+        user = f'user-{rng.randrange(SIMULATED_USERS)}'
+        form_data = rng.choice(form_queries)
+        if kind != 'predict':
+            requests.append((kind, user, form_data, 1))
+            continue
+        page = 1
+        requests.append((kind, user, form_data, page))
+        while page < MAX_PAGE and rng.random() < NEXT_PAGE_PROBABILITY:
+            page += 1
+            requests.append((kind, user, form_data, page))
+    return requests[:count]
+
+
+# Service-account JSON with a throwaway key, enough for firebase_admin.initialize_app
+def fake_firebase_config(project_id):
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption()).decode()
+    return json.dumps({'type': 'service_account', 'project_id': project_id, 'private_key_id': 'bench',
+                       'private_key': pem, 'client_email': f'bench@{project_id}.iam.gserviceaccount.com',
+                       'client_id': '0', 'token_uri': 'https://oauth2.googleapis.com/token'})
+
+
+def resident_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+# Import the app the way a gunicorn worker does and replay requests through the
+# Flask test client. Token checks run against a local signer instead of Firebase.
+def run_worker(job):
+    requests, project_id = job
+    import logging
+    import app as predictor_app
+    from tokens import FakeTokenSigner, PublicKeyCache, TokenVerifier
+    logging.getLogger('tokens').setLevel(logging.CRITICAL)
+    signer = FakeTokenSigner(project_id)
+    predictor_app.token_verifier = TokenVerifier(project_id, PublicKeyCache(signer.fetch_keys))
+    tokens = {}
+    # Returning visitors revalidate the home page with the ETag they were given
+    home_etags = {}
+    client = predictor_app.app.test_client()
+    boot_rss = resident_bytes()
+
+    latencies = {}
+    totals = {}
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    for kind, user, form_data, page in requests:
+        if user not in tokens:
+            tokens[user] = signer.sign(user, f'{user}@gmail.com')
+        headers = {'Authorization': 'Bearer ' + tokens[user]}
+        request_start = time.perf_counter()
+        if kind == 'home':
+            response = client.get('/', headers={'If-None-Match': home_etags[user]} if user in home_etags else {})
+            home_etags[user] = response.headers.get('ETag', '')
+        elif kind == 'download':
+            response = client.get('/download?' + urllib.parse.urlencode(form_data), headers=headers)
+            response.get_data()
+        elif page == 1:
+            response = client.post('/predict', data=form_data, headers=headers)
+        else:
+            response = client.get('/predict?' + urllib.parse.urlencode(dict(form_data, page=page)), headers=headers)
+        latencies.setdefault(kind, []).append(time.perf_counter() - request_start)
+        if response.status_code not in (200, 304) or (response.status_code == 304 and kind != 'home'):
+            raise RuntimeError(f"{kind} {form_data} page {page} returned {response.status_code}")
+        if kind == 'predict':
+            match = re.search(rb'Total Results: (\d+)', response.data)
+            totals[json.dumps(form_data, sort_keys=True)] = int(match.group(1))
+        # Like a WSGI server, close the response so the admission slot is released
+        response.close()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    return {'latencies': latencies, 'elapsed': elapsed, 'cpu': cpu, 'totals': totals, 'boot_rss': boot_rss,
+            'rss': resident_bytes(), 'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+
+# Compare every distinct query with the original mask-chain implementation.
+# Returns the queries whose result set differs.
+def check_oracle(form_queries, http_totals=None):
+    table = load_dataset()
+    data = table.to_frame()
+    engine = QueryEngine(table)
+    mismatches = []
+    for form_data in {json.dumps(q, sort_keys=True): q for q in form_queries}.values():
+        legacy = legacy_predict(data, form_data)
+        if not same_result(data, legacy, engine.predict(Query.from_form(form_data))):
+            mismatches.append(form_data)
+        elif http_totals is not None:
+            total = http_totals.get(json.dumps(form_data, sort_keys=True))
+            if total is not None and total != len(legacy[0]):
+                mismatches.append(form_data)
+    return mismatches
+
+
+def percentiles(values):
+    p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+    return f"p50 {p50:7.2f} ms  p95 {p95:7.2f} ms  p99 {p99:7.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the predictor in-process and check results against the original implementation.')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per worker')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--distinct-queries', type=int, default=400)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-oracle', action='store_true', help='skip the correctness check')
+    args = parser.parse_args()
+
+    table = load_dataset()
+    form_queries = make_form_queries(table, args.distinct_queries, args.seed)
+    del table
+    project_id = 'bench-project'
+    os.environ['FIREBASE_CONFIG'] = fake_firebase_config(project_id)
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    jobs = [(make_requests(form_queries, args.requests, args.seed + worker), project_id)
+            for worker in range(args.workers)]
+
+    # spawn, so each worker imports the app from scratch like a gunicorn worker
+    context = multiprocessing.get_context('spawn')
+    start = time.perf_counter()
+    with context.Pool(args.workers) as pool:
+        results = pool.map(run_worker, jobs)
+    wall = time.perf_counter() - start
+
+    latencies = {}
+    totals = {}
+    for result in results:
+        totals.update(result['totals'])
+        for kind, values in result['latencies'].items():
+            latencies.setdefault(kind, []).extend(values)
+    everything = [value for values in latencies.values() for value in values]
+    busy = max(result['elapsed'] for result in results)
+    print(f"workers: {args.workers}  requests: {len(everything)}  distinct queries: {len(form_queries)}")
+    print(f"throughput: {len(everything) / busy:8.1f} req/s (replay)  {len(everything) / wall:8.1f} req/s (including worker boot)")
+    print(f"CPU per request: {sum(result['cpu'] for result in results) / len(everything) * 1000:.2f} ms")
+    print(f"all        {percentiles(everything)}")
+    for kind, values in sorted(latencies.items()):
+        print(f"{kind:10s} {percentiles(values)}  n={len(values)}")
+    for i, result in enumerate(results):
+        print(f"worker {i}: RSS after boot {result['boot_rss'] / 2 ** 20:6.1f} MB  "
+              f"after run {result['rss'] / 2 ** 20:6.1f} MB  peak {result['peak_rss'] / 2 ** 20:6.1f} MB")
+
+    if args.no_oracle:
+        return 0
+    mismatches = check_oracle(form_queries, totals)
+    print(f"oracle mismatches: {len(mismatches)}")
+    for form_data in mismatches[:5]:
+        print(f"  {form_data}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
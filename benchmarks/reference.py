@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+
+# The original module-level CSV normalization, kept verbatim as the baseline and
+# oracle for the per-unique-value pipeline in dataset.py
+def legacy_load_data(data_file_path):
+    data = pd.read_csv(data_file_path)
+
+    # Handle missing values
+    data['Seat Type'] = data['Seat Type'].fillna('Unknown')
+    data['Stream'] = data['Stream'].fillna('Unknown')
+    data['Program'] = data['Program'].fillna('Unknown')
+    data['Category'] = data['Category'].fillna('Unknown')
+
+    # Normalize columns
+    for col in ['Program', 'Institute', 'Category', 'Quota', 'Round', 'Seat Type']:
+        data[col] = data[col].str.strip().str.title().str.replace('  ', ' ').str.replace('&', 'And')
+    data['Stream'] = data['Stream'].str.strip().str.replace(r'[./]', '/', regex=True).str.replace('  ', ' ').str.title()
+    data['Category'] = data['Category'].str.replace('Obc - A', 'Obc-A').str.replace('Obc - B', 'Obc-B')
+    data['Program'] = data['Program'].str.replace(r'\s*\(.*\)', '', regex=True)
+    data['Year'] = pd.to_numeric(data['Year'], errors='coerce').fillna(0).astype(int)
+    data = data.drop_duplicates()
+    return data.reset_index(drop=True)
+
+
+# The original mask-chain implementation of predict(), kept verbatim (minus logging)
+# as the baseline for benchmarks and as the correctness oracle for the query engine.
+# Returns (filtered_data, min_rank_message, low_rank_message).
+def legacy_predict(data, form_data):
+    rank = int(form_data.get('rank', 0))
+    program = form_data.get('program', 'Any')
+    stream = form_data.get('stream', 'Any')
+    category = form_data.get('category', 'Any')
+    quota = form_data.get('quota', 'Any')
+    seat_type = form_data.get('seat_type', 'Any')
+    round = form_data.get('round', 'Any')
+    year = form_data.get('year', 'Any')
+    filtered_data = data.copy()
+    low_rank_message = None
+    min_rank_message = None
+    temp_data = filtered_data.copy()
+    if program != 'Any':
+        temp_data = temp_data[temp_data['Program'] == program]
+    if stream != 'Any':
+        temp_data = temp_data[temp_data['Stream'] == stream]
+    if category != 'Any':
+        temp_data = temp_data[temp_data['Category'] == category]
+    if quota != 'Any':
+        temp_data = temp_data[temp_data['Quota'] == quota]
+    if seat_type != 'Any':
+        temp_data = temp_data[temp_data['Seat Type'] == seat_type]
+    if round != 'Any':
+        temp_data = temp_data[temp_data['Round'] == round]
+    if year != 'Any':
+        temp_data = temp_data[temp_data['Year'] == int(year)]
+    if temp_data.empty or 'Opening Rank' not in temp_data.columns:
+        min_rank_message = "No colleges found for these filters. Try relaxing filters like Stream, Program, Category, or Year."
+        if stream != 'Any':
+            temp_data = filtered_data.copy()
+            if program != 'Any':
+                temp_data = temp_data[temp_data['Program'] == program]
+            if category != 'Any':
+                temp_data = temp_data[temp_data['Category'] == category]
+            if quota != 'Any':
+                temp_data = temp_data[temp_data['Quota'] == quota]
+            if seat_type != 'Any':
+                temp_data = temp_data[temp_data['Seat Type'] == seat_type]
+            if round != 'Any':
+                temp_data = temp_data[temp_data['Round'] == round]
+            if year != 'Any':
+                temp_data = temp_data[temp_data['Year'] == int(year)]
+            min_rank_message += f" Showing results without Stream filter."
+        filtered_data = pd.DataFrame(columns=data.columns) if temp_data.empty else temp_data
+    else:
+        filtered_data = temp_data[
+            (temp_data['Opening Rank'] <= rank) &
+            (temp_data['Closing Rank'] >= rank)
+        ]
+        if filtered_data.empty:
+            min_rank_message = f"No colleges found for rank {rank}. Showing colleges with opening ranks above or below your rank."
+            filtered_data = temp_data.copy()
+            filtered_data['Rank_Diff'] = abs(filtered_data['Opening Rank'] - rank)
+            filtered_data = filtered_data.sort_values('Rank_Diff').drop(columns=['Rank_Diff'])
+    if not filtered_data.empty and not min_rank_message and len(filtered_data) < 10:
+        low_rank_message = f"Showing additional colleges to provide more options."
+        filtered_data = temp_data.copy()
+        filtered_data['Rank_Diff'] = abs(filtered_data['Opening Rank'] - rank)
+        filtered_data = filtered_data.sort_values('Rank_Diff').drop(columns=['Rank_Diff'])
+    if min_rank_message or low_rank_message:
+        filtered_data = filtered_data.sort_values('Opening Rank')
+    else:
+        filtered_data = filtered_data.sort_values('Closing Rank')
+    return filtered_data, min_rank_message, low_rank_message
+
+
+# Compare an engine Prediction with the legacy result.
+# The legacy sorts are not stable, so rows that tie on the sort key may come out in
+# a different order; the row set, the sort key sequence and the notices must match.
+# Missing ranks (NaN) compare equal to each other.
+def same_result(data, legacy, prediction):
+    filtered_data, min_rank_message, low_rank_message = legacy
+    if (min_rank_message, low_rank_message) != (prediction.min_rank_message, prediction.low_rank_message):
+        return False
+    if len(filtered_data) != len(prediction.rows):
+        return False
+    if sorted(filtered_data.index) != sorted(data.index[prediction.rows]):
+        return False
+    sort_key = 'Opening Rank' if (min_rank_message or low_rank_message) else 'Closing Rank'
+    return np.array_equal(filtered_data[sort_key].to_numpy(np.float64), data[sort_key].iloc[prediction.rows].to_numpy(np.float64),
+                          equal_nan=True)
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# Thread-safe LRU cache with an optional time-to-live and total byte budget.
+# sizeof(value) gives the bytes charged for an entry; oldest entries are evicted
+# until both max_entries and max_bytes hold. Hit, miss and eviction counts are kept
+# for monitoring.
+class LRUCache:
+    def __init__(self, max_entries, max_bytes=None, ttl=None, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof or (lambda value: 0)
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, size, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    # ttl overrides the cache default for this entry
+    def put(self, key, value, ttl=None):
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, size, expires)
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or (
+                    self.max_bytes is not None and self.total_bytes > self.max_bytes):
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def pop(self, key):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.total_bytes, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+    def _remove(self, key):
+        value, size, expires = self.entries.pop(key)
+        self.total_bytes -= size
+
+
+# Per-user prediction results, so /download can serve what the user last looked at
+# without anything being written to disk during /predict. Each result is tagged with
+# the dataset (snapshot path) its row ids index into; a result from another dataset
+# is a miss, since a request that started before a snapshot swap may store it late.
+class ResultStore:
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, ttl=30 * 60):
+        self.results = LRUCache(max_entries, max_bytes, ttl, sizeof=lambda entry: entry[1].rows.nbytes)
+        self.latest_queries = LRUCache(max_entries, ttl=ttl)
+
+    def put(self, user, query, prediction, dataset):
+        self.results.put((user, query), (dataset, prediction))
+        self.latest_queries.put(user, query)
+
+    def get(self, user, query, dataset):
+        entry = self.results.get((user, query))
+        if entry is None or entry[0] != dataset:
+            return None
+        return entry[1]
+
+    def clear(self):
+        self.results.clear()
+
+    # (query, prediction) the user most recently ran, or (None, None); the prediction
+    # is None when it was evicted or computed against another dataset
+    def latest(self, user, dataset):
+        query = self.latest_queries.get(user)
+        if query is None:
+            return None, None
+        return query, self.get(user, query, dataset)
@@ -0,0 +1,381 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Default location of the cutoff table
+DATA_FILE_PATH = 'wbjee_final_clean.xls'  # Local relative path
+SNAPSHOT_DIR = 'snapshot'  # Local relative path
+if os.environ.get('RENDER', 'False') == 'True':
+    DATA_FILE_PATH = '/app/data/wbjee_final_clean.xls'  # Render disk path
+    SNAPSHOT_DIR = '/app/data/snapshot'  # Render disk path
+
+# Set DATASET_MMAP=True to map snapshot columns read-only instead of copying them,
+# so every gunicorn worker shares one copy through the page cache
+DATASET_MMAP = os.environ.get('DATASET_MMAP', 'False') == 'True'
+
+SNAPSHOT_FORMAT = 2
+MANIFEST_NAME = 'manifest.json'
+ROW_HASH_NAME = 'row_hash.npy'
+# Names the snapshot directory workers should serve; replaced atomically on publish
+CURRENT_NAME = 'CURRENT'
+
+
+# Column-oriented cutoff table. Numeric columns are fixed-width arrays; string
+# columns are integer codes into a per-column category list. Arrays loaded with
+# mmap are read-only views of the snapshot files.
+class Table:
+    def __init__(self, columns, categories, path=None):
+        self.columns = columns
+        self.categories = categories
+        self.dtypes = {col: pd.CategoricalDtype(cats) for col, cats in categories.items()}
+        self.path = path
+
+    @classmethod
+    def from_frame(cls, data):
+        columns = {}
+        categories = {}
+        for col in data.columns:
+            if pd.api.types.is_numeric_dtype(data[col]):
+                columns[col] = data[col].to_numpy()
+            else:
+                codes, uniques = pd.factorize(data[col], sort=True)
+                columns[col] = codes.astype(np.int16 if len(uniques) < 2 ** 15 else np.int32)
+                categories[col] = [str(x) for x in uniques]
+        return cls(columns, categories)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    @property
+    def names(self):
+        return list(self.columns)
+
+    # Distinct values of a column, decoded
+    def unique(self, col):
+        if col in self.categories:
+            return list(self.dtypes[col].categories[np.unique(self.columns[col][self.columns[col] >= 0])])
+        return np.unique(self.columns[col]).tolist()
+
+    # DataFrame of the given rows (positional ids or a slice), in order
+    def take(self, rows):
+        frame = {}
+        for col, values in self.columns.items():
+            values = values[rows]
+            if col in self.dtypes:
+                values = pd.Categorical.from_codes(values, dtype=self.dtypes[col])
+            frame[col] = values
+        return pd.DataFrame(frame, columns=self.names)
+
+    def to_frame(self):
+        return self.take(slice(None))
+
+    # Table of the given rows, still dictionary-encoded
+    def subset(self, rows):
+        return Table({col: values[rows] for col, values in self.columns.items()}, self.categories)
+
+    # Rows of this table followed by the rows of another with the same columns. Existing
+    # codes are kept; values new to a column are appended to its category list.
+    def concat(self, other):
+        if other.names != self.names or set(other.categories) != set(self.categories):
+            raise ValueError(f"Column mismatch: {other.names} != {self.names}")
+        columns = {}
+        categories = {}
+        for col in self.names:
+            values = other.columns[col]
+            if col in self.categories:
+                position = {value: code for code, value in enumerate(self.categories[col])}
+                categories[col] = list(self.categories[col])
+                for value in other.categories[col]:
+                    if value not in position:
+                        position[value] = len(categories[col])
+                        categories[col].append(value)
+                # Trailing -1 keeps missing values missing
+                remap = np.array([position[value] for value in other.categories[col]] + [-1])
+                dtype = np.int16 if len(categories[col]) < 2 ** 15 else np.int32
+                values = remap[values].astype(dtype)
+                columns[col] = np.concatenate([self.columns[col].astype(dtype), values])
+            else:
+                columns[col] = np.concatenate([self.columns[col], values])
+        return Table(columns, categories)
+
+
+def _normalize_label(values):
+    return values.str.strip().str.title().str.replace('  ', ' ').str.replace('&', 'And')
+
+
+# Normalization applied to the distinct values of each string column, matching what the
+# form options rely on. Columns filled with 'Unknown' get their missing values replaced first.
+COLUMN_NORMALIZERS = {
+    'Program': lambda values: _normalize_label(values.fillna('Unknown')).str.replace(r'\s*\(.*\)', '', regex=True),
+    'Institute': _normalize_label,
+    'Category': lambda values: _normalize_label(values.fillna('Unknown')).str.replace('Obc - A', 'Obc-A').str.replace('Obc - B', 'Obc-B'),
+    'Quota': _normalize_label,
+    'Round': _normalize_label,
+    'Seat Type': lambda values: _normalize_label(values.fillna('Unknown')),
+    'Stream': lambda values: values.fillna('Unknown').str.strip().str.replace(r'[./]', '/', regex=True).str.replace('  ', ' ').str.title(),
+}
+
+
+# Dictionary-encode a raw CSV frame, normalizing each string column once per distinct
+# value rather than once per row; rows are mapped to the normalized values through codes
+def normalize_frame(data):
+    columns = {}
+    categories = {}
+    for col in data.columns:
+        if col == 'Year':
+            columns[col] = pd.to_numeric(data[col], errors='coerce').fillna(0).astype(int).to_numpy()
+        elif pd.api.types.is_numeric_dtype(data[col]):
+            columns[col] = data[col].to_numpy()
+        else:
+            raw_codes, raw_values = pd.factorize(data[col], use_na_sentinel=False)
+            values = pd.Series(raw_values, dtype=object)
+            if col in COLUMN_NORMALIZERS:
+                values = COLUMN_NORMALIZERS[col](values)
+            # Distinct raw values can normalize to the same string, so re-factorize
+            codes, uniques = pd.factorize(values, sort=True)
+            columns[col] = codes.astype(np.int16 if len(uniques) < 2 ** 15 else np.int32)[raw_codes]
+            categories[col] = [str(x) for x in uniques]
+    return Table(columns, categories)
+
+
+# 64-bit hash of each row's decoded values, comparable across tables with different
+# category lists. Used to drop duplicate rows without a full-table comparison.
+def row_hashes(table):
+    combined = np.zeros(len(table), dtype=np.uint64)
+    for col in table.names:
+        values = table.columns[col]
+        if col in table.categories:
+            # Code -1 (missing) picks the trailing None
+            hashes = pd.util.hash_array(np.array(table.categories[col] + [None], dtype=object))[values]
+        else:
+            hashes = pd.util.hash_array(values)
+        combined = combined * np.uint64(1000003) ^ hashes
+    return combined
+
+
+# Positions of the first row with each hash, in table order (drop_duplicates keep='first')
+def first_occurrences(hashes):
+    return np.sort(np.unique(hashes, return_index=True)[1])
+
+
+# Read and normalize a cutoff CSV into a Table without duplicate rows.
+# Returns the table and its row hashes.
+def load_table(data_file_path=DATA_FILE_PATH):
+    table = normalize_frame(pd.read_csv(data_file_path))
+    hashes = row_hashes(table)
+    keep = first_occurrences(hashes)
+    if len(keep) < len(table):
+        table = table.subset(keep)
+        hashes = hashes[keep]
+    return table, hashes
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Snapshots live in a directory named after the checksum of the source they were built from
+def snapshot_path(source_checksum, snapshot_dir=SNAPSHOT_DIR):
+    return os.path.join(snapshot_dir, source_checksum[:16])
+
+
+# Write the normalized table as one .npy file per column. Numeric columns are stored
+# as-is; string columns are dictionary-encoded (codes + categories in the manifest).
+# The row hashes are stored alongside so later appends can dedup against them.
+def write_snapshot(table, path, source_checksum, hashes, sources=None):
+    columns = []
+    files = {}
+    for i, col in enumerate(table.names):
+        name = f'col{i}.npy'
+        if col in table.categories:
+            columns.append({'name': col, 'file': name, 'kind': 'categorical', 'categories': table.categories[col]})
+        else:
+            columns.append({'name': col, 'file': name, 'kind': 'numeric'})
+        np.save(os.path.join(path, name), table.columns[col])
+        files[name] = file_sha256(os.path.join(path, name))
+    np.save(os.path.join(path, ROW_HASH_NAME), hashes)
+    files[ROW_HASH_NAME] = file_sha256(os.path.join(path, ROW_HASH_NAME))
+    manifest = {'format': SNAPSHOT_FORMAT, 'source_sha256': source_checksum, 'rows': len(table),
+                'sources': sources or [source_checksum], 'columns': columns, 'files': files}
+    with open(os.path.join(path, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f)
+
+
+# Open a snapshot as a Table, mapping the column files read-only when mmap is set.
+# Raises ValueError if the manifest or any column file does not match its checksum.
+def read_snapshot(path, source_checksum=None, mmap=DATASET_MMAP):
+    with open(os.path.join(path, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format in {path}")
+    if source_checksum is not None and manifest['source_sha256'] != source_checksum:
+        raise ValueError(f"Snapshot {path} was built from a different source")
+    columns = {}
+    categories = {}
+    for column in manifest['columns']:
+        file_path = os.path.join(path, column['file'])
+        if file_sha256(file_path) != manifest['files'][column['file']]:
+            raise ValueError(f"Checksum mismatch for {file_path}")
+        # np.asarray drops the memmap subclass but keeps the mapping as the base
+        values = np.asarray(np.load(file_path, mmap_mode='r' if mmap else None))
+        if len(values) != manifest['rows']:
+            raise ValueError(f"{file_path} has {len(values)} rows, expected {manifest['rows']}")
+        columns[column['name']] = values
+        if column['kind'] == 'categorical':
+            categories[column['name']] = column['categories']
+    return Table(columns, categories, path)
+
+
+# Row hashes stored with a snapshot, verified against the manifest
+def read_row_hashes(path):
+    with open(os.path.join(path, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    file_path = os.path.join(path, ROW_HASH_NAME)
+    if file_sha256(file_path) != manifest['files'][ROW_HASH_NAME]:
+        raise ValueError(f"Checksum mismatch for {file_path}")
+    return np.load(file_path)
+
+
+# Snapshot directory named by CURRENT, or None if nothing has been published
+def current_snapshot(snapshot_dir=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(snapshot_dir, CURRENT_NAME)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(snapshot_dir, name) if name else None
+
+
+# Point CURRENT at a snapshot directory. os.replace is atomic, so a worker reading
+# CURRENT sees either the old snapshot or the new one.
+def publish_snapshot(path, snapshot_dir=SNAPSHOT_DIR):
+    fd, tmp_path = tempfile.mkstemp(prefix='.current-', dir=snapshot_dir)
+    with os.fdopen(fd, 'w') as f:
+        f.write(os.path.basename(path))
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, os.path.join(snapshot_dir, CURRENT_NAME))
+
+
+# Write a snapshot and publish it as CURRENT (unless publish is False). The snapshot
+# is written to a temporary directory and renamed into place, so concurrent builders
+# never see a partial snapshot; if another worker built it first its copy is kept.
+def install_snapshot(table, hashes, source_checksum, snapshot_dir=SNAPSHOT_DIR, sources=None, publish=True):
+    path = snapshot_path(source_checksum, snapshot_dir)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix='.build-', dir=snapshot_dir)
+    os.chmod(tmp_path, 0o755)
+    try:
+        write_snapshot(table, tmp_path, source_checksum, hashes, sources)
+        os.rename(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
+    if publish:
+        publish_snapshot(path, snapshot_dir)
+    return path
+
+
+# Normalize a source CSV into a snapshot and publish it as CURRENT (unless publish is False)
+def build_snapshot(data_file_path=DATA_FILE_PATH, snapshot_dir=SNAPSHOT_DIR, publish=True):
+    table, hashes = load_table(data_file_path)
+    path = install_snapshot(table, hashes, file_sha256(data_file_path), snapshot_dir, publish=publish)
+    return path, table
+
+
+# Append a new year's or round's CSV to the CURRENT snapshot. Only the new rows are
+# normalized; rows already in the snapshot are dropped by row hash, and the existing
+# columns are copied without being decoded. The result is published as CURRENT under
+# a checksum chained from the previous snapshot and the new file.
+def append_snapshot(data_file_path, snapshot_dir=SNAPSHOT_DIR):
+    base_path = current_snapshot(snapshot_dir)
+    if base_path is None:
+        raise ValueError(f"No published snapshot in {snapshot_dir}; run build first")
+    with open(os.path.join(base_path, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    base = read_snapshot(base_path, mmap=True)
+    base_hashes = read_row_hashes(base_path)
+    new_checksum = file_sha256(data_file_path)
+    table, hashes = load_table(data_file_path)
+    fresh = np.flatnonzero(~np.isin(hashes, base_hashes))
+    if len(fresh) == 0:
+        return base_path, base, 0
+    source_checksum = hashlib.sha256((manifest['source_sha256'] + new_checksum).encode()).hexdigest()
+    table = base.concat(table.subset(fresh))
+    hashes = np.concatenate([base_hashes, hashes[fresh]])
+    path = install_snapshot(table, hashes, source_checksum, snapshot_dir, manifest['sources'] + [new_checksum])
+    return path, table, len(fresh)
+
+
+# Load the published table. A source CSV without a snapshot is new data: it is
+# normalized and published first. Otherwise CURRENT wins, so data published with
+# `python dataset.py build` survives restarts. If CURRENT cannot be read this process
+# serves the source CSV's snapshot instead, leaving CURRENT and the broken snapshot
+# for an operator; only a broken source snapshot is rebuilt, and then it is not
+# published over CURRENT. Falls back to parsing the CSV if the snapshot cannot be
+# written (e.g. a read-only disk).
+def load_dataset(data_file_path=DATA_FILE_PATH, snapshot_dir=SNAPSHOT_DIR, mmap=DATASET_MMAP):
+    source_checksum = file_sha256(data_file_path)
+    source_path = snapshot_path(source_checksum, snapshot_dir)
+    current = current_snapshot(snapshot_dir)
+    current_failed = False
+    if os.path.isfile(os.path.join(source_path, MANIFEST_NAME)):
+        if current is not None and current != source_path:
+            try:
+                return read_snapshot(current, mmap=mmap)
+            except (OSError, ValueError, KeyError) as e:
+                current_failed = True
+                logger.error(f"Could not load published snapshot {current}, serving {source_path} in this process: {e}")
+        try:
+            return read_snapshot(source_path, source_checksum, mmap=mmap)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Rebuilding snapshot {source_path}: {e}")
+            shutil.rmtree(source_path, ignore_errors=True)
+    try:
+        path, table = build_snapshot(data_file_path, snapshot_dir, publish=not current_failed)
+    except OSError as e:
+        logger.warning(f"Could not write snapshot to {snapshot_dir}: {e}")
+        return load_table(data_file_path)[0]
+    return read_snapshot(path, source_checksum, mmap=mmap)
+
+
+# Sorted option lists for the predictor form dropdowns
+def form_options(table):
+    return {
+        'programs': sorted([x for x in table.unique('Program') if pd.notna(x) and x != 'Unknown']),
+        'streams': sorted([x for x in table.unique('Stream') if pd.notna(x) and x != 'Unknown']),
+        'categories': sorted([x for x in table.unique('Category') if pd.notna(x) and x != 'Unknown']),
+        'quotas': sorted([x for x in table.unique('Quota') if pd.notna(x)]),
+        'seat_types': sorted([x for x in table.unique('Seat Type') if pd.notna(x) and x != 'Unknown']),
+        'rounds': sorted([x for x in table.unique('Round') if pd.notna(x)]),
+        'years': sorted([x for x in table.unique('Year') if x != 0]),
+    }
+
+
+# Offline steps, picked up by running workers without a restart:
+#   python dataset.py build [source.csv] [snapshot_dir]
+#   python dataset.py append new_rows.csv [snapshot_dir]
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('build', 'append') or (sys.argv[1] == 'append' and len(sys.argv) < 3):
+        sys.exit("usage: python dataset.py build [source.csv] [snapshot_dir]\n"
+                 "       python dataset.py append new_rows.csv [snapshot_dir]")
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1] == 'append':
+        path, table, added = append_snapshot(*sys.argv[2:4])
+        print(f"Appended {added} new rows, published {len(table)} rows from {path}")
+    else:
+        path, table = build_snapshot(*sys.argv[2:4])
+        print(f"Published {len(table)} rows from {path}")
@@ -0,0 +1,354 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from cache import LRUCache
+from dataset import SNAPSHOT_DIR, current_snapshot, form_options, load_dataset, read_snapshot
+from metrics import STAGE_SECONDS
+from simulate import Simulator
+from trends import TrendTable
+
+logger = logging.getLogger(__name__)
+
+# Form fields that filter the cutoff table, mapped to their column
+FILTER_COLUMNS = {
+    'program': 'Program',
+    'stream': 'Stream',
+    'category': 'Category',
+    'quota': 'Quota',
+    'seat_type': 'Seat Type',
+    'round': 'Round',
+    'year': 'Year',
+}
+
+# Below this many rank matches the predictor widens to the whole filtered set
+MIN_MATCHES = 10
+
+EMPTY_ROWS = np.empty(0, dtype=np.int64)
+
+# Interval tree nodes at or below this size are scanned directly
+LEAF_SIZE = 64
+
+# Filter partitions whose rank index is kept in memory; shared by every rank
+PARTITION_CACHE_SIZE = 1024
+PARTITION_CACHE_BYTES = 128 * 1024 * 1024
+
+# Upper bound on rank x row cells compared at once when matching a batch of ranks
+BATCH_CELLS = 4 * 1024 * 1024
+
+# Seconds between checks for a newly published snapshot
+RELOAD_CHECK_INTERVAL = 5
+
+# Finished predictions keyed by the full query, so paging is a slice of cached row ids
+RESULT_CACHE_SIZE = 4096
+RESULT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+# Normalized /predict query; 'Any' means the filter is not applied
+class Query(namedtuple('Query', ['rank'] + list(FILTER_COLUMNS))):
+    __slots__ = ()
+
+    @classmethod
+    def from_form(cls, form_data):
+        year = form_data.get('year', 'Any')
+        return cls(
+            rank=int(form_data.get('rank', 0)),
+            program=form_data.get('program', 'Any'),
+            stream=form_data.get('stream', 'Any'),
+            category=form_data.get('category', 'Any'),
+            quota=form_data.get('quota', 'Any'),
+            seat_type=form_data.get('seat_type', 'Any'),
+            round=form_data.get('round', 'Any'),
+            year=year if year == 'Any' else int(year),
+        )
+
+    # Column -> value for every filter that is not 'Any'
+    def filters(self):
+        return {col: getattr(self, field) for field, col in FILTER_COLUMNS.items()
+                if getattr(self, field) != 'Any'}
+
+
+# Ordered result row ids plus the notices shown above the results table
+Prediction = namedtuple('Prediction', ['rows', 'min_rank_message', 'low_rank_message'])
+
+NO_FILTER_MATCH_MESSAGE = "No colleges found for these filters. Try relaxing filters like Stream, Program, Category, or Year."
+LOW_MATCH_MESSAGE = "Showing additional colleges to provide more options."
+
+
+# One node of a centered interval tree over [Opening Rank, Closing Rank].
+# Intervals containing the center are kept twice: ordered by opening rank and by
+# closing rank (descending), so a stabbing query takes a prefix of one of them.
+class _IntervalNode:
+    __slots__ = ('center', 'by_start', 'starts', 'by_end', 'neg_ends', 'left', 'right')
+
+    def __init__(self, rows, opening, closing):
+        lo = opening[rows]
+        hi = closing[rows]
+        if len(rows) <= LEAF_SIZE:
+            self.center = None
+            self.by_start, self.starts, self.neg_ends = rows, lo, -hi
+            return
+        # The median endpoint guarantees both children are strictly smaller
+        self.center = np.median(np.concatenate((lo, hi)))
+        here = (lo <= self.center) & (hi >= self.center)
+        order = np.argsort(lo[here], kind='stable')
+        self.by_start = rows[here][order]
+        self.starts = lo[here][order]
+        order = np.argsort(-hi[here], kind='stable')
+        self.by_end = rows[here][order]
+        self.neg_ends = -hi[here][order]
+        left = hi < self.center
+        right = lo > self.center
+        self.left = _IntervalNode(rows[left], opening, closing) if left.any() else None
+        self.right = _IntervalNode(rows[right], opening, closing) if right.any() else None
+
+
+# Rank index over one filter partition (the rows left after the categorical filters).
+# Answers "which rows have Opening Rank <= rank <= Closing Rank" in O(log n + k)
+# and keeps the partition pre-sorted by opening rank for the widened results and by
+# closing rank for batch matching. Rows with a missing (NaN) rank never contain a
+# rank, so they are left out of the tree and the rank-sorted arrays; they still
+# appear in widened results, last, as in the mask chain.
+class RankIndex:
+    def __init__(self, rows, opening, closing):
+        order = np.argsort(opening[rows], kind='stable')
+        self.by_opening = rows[order]
+        ranked = rows[~(np.isnan(opening[rows]) | np.isnan(closing[rows]))]
+        self.opening_sorted = np.sort(opening[ranked])
+        order = np.argsort(closing[ranked], kind='stable')
+        self.by_closing = ranked[order]
+        self.closing_sorted = closing[self.by_closing]
+        self.opening_by_closing = opening[self.by_closing]
+        self.tree = _IntervalNode(ranked, opening, closing) if len(ranked) else None
+        self.closing = closing
+        # Every row sits in exactly one tree node (stored twice above the leaves)
+        self.nbytes = 8 * self.by_opening.nbytes
+
+    def __len__(self):
+        return len(self.by_opening)
+
+    # Number of rows containing rank; every interval has opening <= closing, so
+    # this is (#opening <= rank) - (#closing < rank)
+    # Works elementwise on an array of ranks.
+    def count(self, rank):
+        return (np.searchsorted(self.opening_sorted, rank, side='right')
+                - np.searchsorted(self.closing_sorted, rank, side='left'))
+
+    # Row ids ordered by closing rank (ties keep table order)
+    def order_by_closing(self, rows):
+        rows = np.sort(rows)
+        return rows[np.argsort(self.closing[rows], kind='stable')]
+
+    # For each rank, the row ids containing it ordered by closing rank. Ranks are
+    # broadcast against the closing-ordered bounds, so each chunk of ranks is a
+    # single vectorized comparison and the matches come out already sorted.
+    def matching_many(self, ranks):
+        chunk = max(1, BATCH_CELLS // max(len(self), 1))
+        matches = []
+        for start in range(0, len(ranks), chunk):
+            block = np.asarray(ranks[start:start + chunk])[:, None]
+            mask = (self.opening_by_closing <= block) & (self.closing_sorted >= block)
+            matches.extend(self.by_closing[row] for row in mask)
+        return matches
+
+    # Row ids (unordered) whose [Opening Rank, Closing Rank] contains rank
+    def containing(self, rank):
+        found = []
+        node = self.tree
+        while node is not None:
+            if node.center is None:
+                found.append(node.by_start[(node.starts <= rank) & (node.neg_ends <= -rank)])
+                break
+            if rank < node.center:
+                found.append(node.by_start[:np.searchsorted(node.starts, rank, side='right')])
+                node = node.left
+            elif rank > node.center:
+                found.append(node.by_end[:np.searchsorted(node.neg_ends, -rank, side='right')])
+                node = node.right
+            else:
+                found.append(node.by_start)
+                break
+        return np.concatenate(found) if found else EMPTY_ROWS
+
+
+# Categorical index over the cutoff table, built once per loaded snapshot.
+# Each filter column is stored as integer codes with a posting list (sorted row ids)
+# per value, so a query starts from the most selective posting list and only
+# checks the codes of rows that are still candidates.
+class QueryEngine:
+    def __init__(self, table):
+        self.table = table
+        self.num_rows = len(table)
+        self.all_rows = np.arange(self.num_rows, dtype=np.int64)
+        self.opening = table.columns['Opening Rank']
+        self.closing = table.columns['Closing Rank']
+        self.codes = {}
+        self.lookup = {}
+        self.postings = {}
+        for col in FILTER_COLUMNS.values():
+            if col in table.categories:
+                codes, uniques = table.columns[col], table.categories[col]
+            else:
+                codes, uniques = pd.factorize(table.columns[col])
+            order = np.argsort(codes, kind='stable')
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            # Missing values are coded -1 and sort first; they never match a filter
+            start = len(codes) - counts.sum()
+            self.codes[col] = codes
+            self.lookup[col] = {value: code for code, value in enumerate(uniques)}
+            self.postings[col] = np.split(order[start:], np.cumsum(counts)[:-1])
+        self.options = form_options(table)
+        # Closing-rank history and expected cutoffs per seat, for trend predictions
+        self.trends = TrendTable(table)
+        self.simulator = Simulator(self.trends)
+        self.partitions = LRUCache(PARTITION_CACHE_SIZE, PARTITION_CACHE_BYTES, sizeof=lambda index: index.nbytes)
+        self.results = LRUCache(RESULT_CACHE_SIZE, RESULT_CACHE_BYTES, sizeof=lambda prediction: prediction.rows.nbytes)
+
+    # Row ids (ascending) matching every column == value filter
+    def select(self, filters):
+        terms = []
+        for col, value in filters.items():
+            code = self.lookup[col].get(value)
+            if code is None:
+                return EMPTY_ROWS
+            terms.append((col, code))
+        if not terms:
+            return self.all_rows
+        terms.sort(key=lambda term: len(self.postings[term[0]][term[1]]))
+        col, code = terms[0]
+        rows = self.postings[col][code]
+        for col, code in terms[1:]:
+            if not len(rows):
+                break
+            rows = rows[self.codes[col][rows] == code]
+        return rows
+
+    # Rank index for the rows matching filters, built on first use and kept in an LRU
+    def partition(self, filters):
+        key = tuple(filters.items())
+        index = self.partitions.get(key)
+        if index is None:
+            index = RankIndex(self.select(filters), self.opening, self.closing)
+            self.partitions.put(key, index)
+        return index
+
+    # Cached prediction for query; the rank stage runs on top of the shared partition
+    def predict(self, query):
+        prediction = self.results.get(query)
+        if prediction is None:
+            prediction = self._predict(query)
+            self._cache(query, prediction)
+        return prediction
+
+    # Predictions for many queries at once. Queries are grouped by filter partition
+    # and each group's ranks are matched in one vectorized pass.
+    def predict_many(self, queries):
+        predictions = [self.results.get(query) for query in queries]
+        groups = {}
+        for i, query in enumerate(queries):
+            if predictions[i] is None:
+                groups.setdefault(tuple(query.filters().items()), []).append(i)
+        for key, positions in groups.items():
+            start = time.perf_counter()
+            index = self.partition(dict(key))
+            STAGE_SECONDS.observe('filter', time.perf_counter() - start)
+            if not len(index):
+                for i in positions:
+                    predictions[i] = self._predict(queries[i])
+                    self._cache(queries[i], predictions[i])
+                continue
+            start = time.perf_counter()
+            ranks = np.array([queries[i].rank for i in positions])
+            counts = index.count(ranks)
+            exact = counts >= MIN_MATCHES
+            matches = iter(index.matching_many(ranks[exact]))
+            STAGE_SECONDS.observe('rank_match', time.perf_counter() - start)
+            for i, rank, count, is_exact in zip(positions, ranks.tolist(), counts.tolist(), exact.tolist()):
+                predictions[i] = self._rank_stage(index, rank, count, next(matches) if is_exact else None)
+                self._cache(queries[i], predictions[i])
+        return predictions
+
+    def _cache(self, query, prediction):
+        # Cached row ids are shared between requests
+        prediction.rows.flags.writeable = False
+        self.results.put(query, prediction)
+
+    # Same result set and ordering rules as the original mask chain in predict().
+    # Ties on the sort key keep table order.
+    def _predict(self, query):
+        filters = query.filters()
+        start = time.perf_counter()
+        index = self.partition(filters)
+        filtered = time.perf_counter()
+        STAGE_SECONDS.observe('filter', filtered - start)
+        if not len(index):
+            min_rank_message = NO_FILTER_MATCH_MESSAGE
+            if query.stream != 'Any':
+                del filters['Stream']
+                index = self.partition(filters)
+                min_rank_message += " Showing results without Stream filter."
+            STAGE_SECONDS.observe('fallback', time.perf_counter() - filtered)
+            return Prediction(index.by_opening, min_rank_message, None)
+        count = int(index.count(query.rank))
+        matched = index.containing(query.rank) if count >= MIN_MATCHES else None
+        ranked = time.perf_counter()
+        STAGE_SECONDS.observe('rank_match', ranked - filtered)
+        if matched is not None:
+            matched = index.order_by_closing(matched)
+            STAGE_SECONDS.observe('sort', time.perf_counter() - ranked)
+        return self._rank_stage(index, query.rank, count, matched)
+
+    # Pick the result for a non-empty partition given how many rows contain rank;
+    # matched holds those rows (closing rank order) when there are enough of them.
+    # Widened results are the whole partition by opening rank, already in that order.
+    def _rank_stage(self, index, rank, count, matched):
+        if not count:
+            return Prediction(index.by_opening, f"No colleges found for rank {rank}. Showing colleges with opening ranks above or below your rank.", None)
+        if count < MIN_MATCHES:
+            return Prediction(index.by_opening, None, LOW_MATCH_MESSAGE)
+        return Prediction(matched, None, None)
+
+    # DataFrame of the given row ids, in order
+    def frame(self, rows):
+        return self.table.take(rows)
+
+    def cache_stats(self):
+        return {'partitions': self.partitions.stats(), 'results': self.results.stats()}
+
+
+# Holds the engine for the published snapshot and swaps in a new one when
+# `python dataset.py build` publishes fresh data, without restarting the worker.
+# Requests read `engine` once and keep using that object, so a swap never mixes
+# row ids from two tables.
+class LiveEngine:
+    def __init__(self, snapshot_dir=SNAPSHOT_DIR, check_interval=RELOAD_CHECK_INTERVAL):
+        self.snapshot_dir = snapshot_dir
+        self.check_interval = check_interval
+        self.engine = QueryEngine(load_dataset(snapshot_dir=snapshot_dir))
+        self.next_check = time.monotonic() + check_interval
+        self.reload_lock = threading.Lock()
+
+    # Load the published snapshot if it changed; returns True when the engine was swapped
+    def refresh(self):
+        now = time.monotonic()
+        if now < self.next_check or not self.reload_lock.acquire(blocking=False):
+            return False
+        try:
+            self.next_check = now + self.check_interval
+            path = current_snapshot(self.snapshot_dir)
+            if path is None or path == self.engine.table.path:
+                return False
+            try:
+                engine = QueryEngine(read_snapshot(path))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Keeping current dataset, could not load {path}: {e}")
+                return False
+            self.engine = engine
+            logger.info(f"Switched to snapshot {path} ({engine.num_rows} rows)")
+            return True
+        finally:
+            self.reload_lock.release()
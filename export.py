@@ -0,0 +1,39 @@
+import zlib
+
+# Rows serialized per chunk; memory use is bounded by one chunk regardless of result size
+EXPORT_CHUNK_SIZE = 1000
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+# CSV of the given rows in order: a header line, then one chunk of rows at a time
+def iter_csv(table, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    yield table.take(rows[:0]).to_csv(index=False)
+    for start in range(0, len(rows), chunk_size):
+        yield table.take(rows[start:start + chunk_size]).to_csv(index=False, header=False)
+
+
+# One JSON object per row, newline-delimited
+def iter_ndjson(table, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    for start in range(0, len(rows), chunk_size):
+        yield table.take(rows[start:start + chunk_size]).to_json(orient='records', lines=True, force_ascii=False)
+
+
+def iter_export(table, rows, fmt, chunk_size=EXPORT_CHUNK_SIZE):
+    if fmt == 'ndjson':
+        return iter_ndjson(table, rows, chunk_size)
+    return iter_csv(table, rows, chunk_size)
+
+
+# Encode text chunks as UTF-8 and gzip them as a single stream. Each chunk is
+# sync-flushed so the client receives data as soon as it is serialized.
+def iter_gzip(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
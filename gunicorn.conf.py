@@ -0,0 +1,15 @@
+import os
+
+# gthread workers serve each connection on a thread from a pool, so a request waiting
+# on Firebase signing keys or streaming an export does not hold up the others. The
+# admission lanes in app.py bound how many run at once; the pool must be at least
+# their in-flight plus queue slots, with a few spare for the index page and /metrics.
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+# Connections a worker accepts before leaving the rest in the listen backlog
+worker_connections = int(os.environ.get('GUNICORN_CONNECTIONS', 256))
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
@@ -0,0 +1,81 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# Cumulative histogram with one label, rendered in the Prometheus text format.
+# Each gunicorn worker keeps its own counts.
+class Histogram:
+    def __init__(self, name, documentation, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += seconds
+
+    @contextmanager
+    def time(self, label_value):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(label_value, time.perf_counter() - start)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self.series.items()}
+        for label_value, (counts, total) in sorted(series.items()):
+            label = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label}}} {total}')
+            lines.append(f'{self.name}_count{{{label}}} {cumulative}')
+        return '\n'.join(lines)
+
+
+# Per-stage latency: auth, filter, rank_match, fallback, sort, trend, simulate, render, export
+STAGE_SECONDS = Histogram('predictor_stage_seconds', 'Time spent in each request stage.', 'stage')
+# End-to-end handler latency per endpoint (streamed bodies are covered by the export stage)
+REQUEST_SECONDS = Histogram('predictor_request_seconds', 'Request handling time by endpoint.', 'endpoint')
+
+
+# Counters and gauges from {'name': (type, help, {label_value: value})}, labelled by `label`
+def render_values(values, label):
+    lines = []
+    for name, (kind, documentation, samples) in values.items():
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {kind}')
+        for label_value, value in sorted(samples.items()):
+            lines.append(f'{name}{{{label}="{label_value}"}} {value}')
+    return '\n'.join(lines)
+
+
+# Re-yield chunks while timing how long producing them took, excluding the time
+# the server spends sending each chunk
+def timed_chunks(chunks, histogram, label_value):
+    elapsed = 0.0
+    start = time.perf_counter()
+    for chunk in chunks:
+        elapsed += time.perf_counter() - start
+        yield chunk
+        start = time.perf_counter()
+    elapsed += time.perf_counter() - start
+    histogram.observe(label_value, elapsed)
@@ -0,0 +1,66 @@
+import hashlib
+import os
+import time
+
+import numpy as np
+from flask import Response
+from markupsafe import Markup, escape
+
+from dataset import MANIFEST_NAME
+
+
+# <tr> rows for a page of results, built straight from the column arrays instead of
+# a DataFrame and a template loop. String columns are escaped once per category.
+class RowRenderer:
+    def __init__(self, table, columns):
+        self.cells = []
+        for col in columns:
+            if col in table.categories:
+                # Code -1 (missing) picks the trailing 'nan', as the template printed it
+                labels = np.array([str(escape(value)) for value in table.categories[col]] + ['nan'], dtype=object)
+                self.cells.append((table.columns[col], labels))
+            else:
+                self.cells.append((table.columns[col], None))
+
+    def render(self, rows):
+        columns = []
+        for values, labels in self.cells:
+            values = values[rows]
+            columns.append(labels[values].tolist() if labels is not None else [str(value) for value in values.tolist()])
+        return Markup(''.join(f"<tr><td>{'</td><td>'.join(cells)}</td></tr>\n" for cells in zip(*columns)))
+
+
+# A page rendered once and served with an ETag and Last-Modified. Clients revalidate
+# on each visit and get 304 Not Modified while the page is unchanged.
+class StaticPage:
+    def __init__(self, body, last_modified):
+        self.body = body.encode()
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self.last_modified = last_modified
+
+    def response(self, request):
+        response = Response(self.body, mimetype='text/html')
+        response.set_etag(self.etag)
+        response.last_modified = self.last_modified
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+
+# When the table was published: the snapshot build time, or now for a table parsed
+# from CSV. Every worker serving the same snapshot reports the same time.
+def table_modified(table):
+    if table.path is not None:
+        try:
+            return int(os.path.getmtime(os.path.join(table.path, MANIFEST_NAME)))
+        except OSError:
+            pass
+    return int(time.time())
+
+
+# The pre-rendered index page and the row renderer for one engine's table. Handlers
+# take both from the same EnginePages so a snapshot swap cannot mix tables.
+class EnginePages:
+    def __init__(self, engine, index_template, columns):
+        self.engine = engine
+        self.index = StaticPage(index_template.render(form_data={}, **engine.options), table_modified(engine.table))
+        self.rows = RowRenderer(engine.table, columns)
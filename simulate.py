@@ -0,0 +1,188 @@
+import argparse
+import json
+import multiprocessing
+import re
+import sys
+import time
+
+import numpy as np
+
+from dataset import current_snapshot, read_snapshot
+from trends import DEFAULT_SEAT_TYPE, TrendTable
+
+# Students per task handed to a pool worker
+SIMULATION_CHUNK_SIZE = 200
+
+
+# Round names in counselling order ('Round 2' before 'Round 10')
+def round_order(names):
+    return sorted(range(len(names)), key=lambda i: [int(part) if part.isdigit() else part
+                                                    for part in re.split(r'(\d+)', names[i])])
+
+
+# Walks a student's ordered preference list through each year's counselling rounds
+# using the historical closing ranks of the seat matrix (a TrendTable). A preference
+# is offered in a round when some matching seat closed at or beyond the rank; the
+# student then holds the best preference offered so far and can only move up in
+# later rounds.
+class Simulator:
+    def __init__(self, trends):
+        self.trends = trends
+        self.years = trends.years.tolist()
+        names = trends.categories['Round']
+        self.rounds = [names[i] for i in round_order(names)]
+        # Position of each key's round in counselling order
+        position = np.empty(len(names) + 1, dtype=np.int64)
+        position[np.array(round_order(names), dtype=np.int64)] = np.arange(len(names))
+        position[-1] = len(names)
+        self.round_of_key = position[trends.key_codes['Round']]
+        # Rounds that took place in each year
+        took_place = np.zeros((len(names) + 1, len(self.years)), dtype=bool)
+        np.logical_or.at(took_place, self.round_of_key, ~np.isnan(trends.closing))
+        self.took_place = took_place[:len(names)]
+        # Key ids per (institute, program), for looking up one preference
+        institutes = trends.key_codes['Institute'].astype(np.int64)
+        programs = trends.key_codes['Program'].astype(np.int64)
+        packed = institutes * (len(trends.categories['Program']) + 1) + programs
+        order = np.argsort(packed, kind='stable')
+        bounds = np.flatnonzero(np.diff(packed[order])) + 1
+        self.seats = {}
+        for keys in np.split(order, bounds):
+            if len(keys):
+                self.seats[(int(institutes[keys[0]]), int(programs[keys[0]]))] = keys
+
+    # Keys of one preference that match the student's category, quota and seat type
+    def preference_keys(self, institute, program, filters):
+        institute = self.trends.lookup['Institute'].get(institute)
+        program = self.trends.lookup['Program'].get(program)
+        keys = self.seats.get((institute, program))
+        if keys is None:
+            return None
+        for col, value in filters.items():
+            code = self.trends.lookup[col].get(value)
+            if code is None:
+                return keys[:0]
+            keys = keys[self.trends.key_codes[col][keys] == code]
+        return keys
+
+    # Per year: the preference held after each round and the first allotment.
+    # Preferences are (institute, program) pairs, best first; category and quota
+    # restrict the seats considered ('Any' for no restriction). seat_type picks the
+    # rank pool: WBJEE seats unless another is named, since JEE(Main) seats close on
+    # the JEE(Main) rank scale.
+    def simulate(self, rank, preferences, category='Any', quota='Any', seat_type='Any'):
+        if seat_type == 'Any':
+            seat_type = DEFAULT_SEAT_TYPE
+        filters = {col: value for col, value in [('Category', category), ('Quota', quota), ('Seat Type', seat_type)]
+                   if value != 'Any'}
+        num_rounds = len(self.rounds)
+        # offered[p, r, y]: preference p had a seat closing at or beyond rank in round r of year y
+        offered = np.zeros((len(preferences), num_rounds + 1, len(self.years)), dtype=bool)
+        unmatched = []
+        for p, (institute, program) in enumerate(preferences):
+            keys = self.preference_keys(institute, program, filters)
+            if keys is None:
+                unmatched.append(p + 1)
+                continue
+            np.logical_or.at(offered[p], self.round_of_key[keys], self.trends.closing[keys] >= rank)
+        offered = offered[:, :num_rounds]
+
+        # Best preference offered in each round (len(preferences) = none), then the
+        # best held so far, since a student only moves up. Without preferences
+        # nothing is ever offered.
+        none = len(preferences)
+        if preferences:
+            best = np.where(offered.any(axis=0), offered.argmax(axis=0), none)
+        else:
+            best = np.full((num_rounds, len(self.years)), none)
+        holding = np.minimum.accumulate(np.where(self.took_place, best, none), axis=0)
+
+        years = []
+        for y, year in enumerate(self.years):
+            rounds = []
+            allotment = None
+            for r, name in enumerate(self.rounds):
+                if not self.took_place[r, y]:
+                    continue
+                preference = int(holding[r, y])
+                if preference == none:
+                    rounds.append({'round': name, 'preference': None})
+                    continue
+                rounds.append({'round': name, 'preference': preference + 1})
+                if allotment is None:
+                    institute, program = preferences[preference]
+                    allotment = {'round': name, 'preference': preference + 1, 'institute': institute, 'program': program}
+            years.append({'year': year, 'allotment': allotment, 'rounds': rounds})
+        return {'years': years, 'unmatched_preferences': unmatched}
+
+    # Simulate one student given as a dict: rank, preferences (a list of
+    # {"institute", "program"}), and optional category, quota, seat_type and id.
+    # Raises ValueError for a malformed student.
+    def simulate_student(self, student):
+        if not isinstance(student, dict):
+            raise ValueError('Each student must be an object')
+        preferences = student.get('preferences')
+        if not isinstance(preferences, list) or not all(isinstance(p, dict) for p in preferences):
+            raise ValueError('preferences must be a list of {"institute", "program"} objects')
+        result = self.simulate(int(student.get('rank', 0)),
+                               [(p.get('institute'), p.get('program')) for p in preferences],
+                               student.get('category', 'Any'), student.get('quota', 'Any'),
+                               student.get('seat_type', 'Any'))
+        if 'id' in student:
+            result = dict(id=student['id'], **result)
+        return result
+
+
+# Pool workers map the snapshot read-only, so every worker shares one copy of the
+# rank table through the page cache, and build their own seat matrix from it
+_worker_simulator = None
+
+
+def _init_worker(snapshot_path):
+    global _worker_simulator
+    _worker_simulator = Simulator(TrendTable(read_snapshot(snapshot_path, mmap=True)))
+
+
+def _simulate_chunk(students):
+    results = []
+    for student in students:
+        try:
+            results.append(_worker_simulator.simulate_student(student))
+        except (TypeError, ValueError) as e:
+            results.append({'id': student.get('id') if isinstance(student, dict) else None, 'error': str(e)})
+    return results
+
+
+# Simulate many students in a process pool over the published snapshot. Results are
+# yielded in input order; a malformed student yields {"id", "error"}.
+def simulate_batch(students, workers=None, snapshot_path=None, chunk_size=SIMULATION_CHUNK_SIZE):
+    snapshot_path = snapshot_path or current_snapshot()
+    if snapshot_path is None:
+        raise ValueError('No published snapshot; run python dataset.py build first')
+    chunks = (students[i:i + chunk_size] for i in range(0, len(students), chunk_size))
+    # spawn, so workers never inherit a forked copy of a threaded server process
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(workers, _init_worker, (snapshot_path,)) as pool:
+        for results in pool.imap(_simulate_chunk, chunks):
+            yield from results
+
+
+# Offline batch job: one student per line of NDJSON in, one result per line out
+#   python simulate.py students.ndjson [--workers N] [--snapshot DIR] > results.ndjson
+def main():
+    parser = argparse.ArgumentParser(description='Simulate counselling rounds for a list of students.')
+    parser.add_argument('students', help='NDJSON file, one student per line')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--snapshot', default=None, help='snapshot directory (default: the published one)')
+    args = parser.parse_args()
+
+    with open(args.students) as f:
+        students = [json.loads(line) for line in f if line.strip()]
+    start = time.perf_counter()
+    for result in simulate_batch(students, args.workers, args.snapshot):
+        sys.stdout.write(json.dumps(result) + '\n')
+    print(f"Simulated {len(students)} students in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.request
+
+import jwt
+from cryptography import x509
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Public certificates Google signs Firebase ID tokens with
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+ISSUER_PREFIX = 'https://securetoken.google.com/'
+
+# Refresh the keys this long before Google's Cache-Control max-age runs out
+REFRESH_MARGIN = 300
+# Wait this long before retrying a failed refresh or re-fetching for an unknown key id
+RETRY_INTERVAL = 60
+# How long a newly started worker waits for its first key fetch. The wait is shared
+# by every request in that window; after it, requests fail fast until keys arrive.
+INITIAL_FETCH_TIMEOUT = 10
+
+TOKEN_CACHE_SIZE = 10000
+
+
+class InvalidTokenError(ValueError):
+    pass
+
+
+# Fetch Google's signing certificates: returns ({kid: public_key}, max_age_seconds)
+def fetch_google_keys(url=GOOGLE_CERTS_URL, timeout=10):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        certs = json.load(response)
+        match = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+    keys = {kid: x509.load_pem_x509_certificate(pem.encode()).public_key() for kid, pem in certs.items()}
+    return keys, int(match.group(1)) if match else 3600
+
+
+# Token signing keys held in memory. A daemon thread refreshes them ahead of expiry,
+# so verification never waits on the network except for a worker's very first fetch.
+class PublicKeyCache:
+    def __init__(self, fetch=fetch_google_keys):
+        self.fetch = fetch
+        self.keys = {}
+        self.expires = 0
+        self.last_fetch = 0
+        self.loaded = threading.Event()
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        self.pid = None
+        self.initial_deadline = 0
+
+    # Threads do not survive a fork, so each gunicorn worker starts its own refresher
+    def ensure_started(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.initial_deadline = time.monotonic() + INITIAL_FETCH_TIMEOUT
+            threading.Thread(target=self._run, name='token-key-refresh', daemon=True).start()
+
+    def get(self, kid):
+        self.ensure_started()
+        if not self.loaded.is_set():
+            self.loaded.wait(max(self.initial_deadline - time.monotonic(), 0))
+        key = self.keys.get(kid)
+        if key is None and time.time() - self.last_fetch > RETRY_INTERVAL:
+            # Possibly a rotated key; fetch in the background and reject this token
+            self.wake.set()
+        return key
+
+    def refresh(self):
+        keys, max_age = self.fetch()
+        self.last_fetch = time.time()
+        self.keys = keys
+        self.expires = self.last_fetch + max_age
+        self.loaded.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+                delay = max(self.expires - time.time() - REFRESH_MARGIN, RETRY_INTERVAL)
+            except Exception as e:
+                logger.error(f"Failed to refresh token signing keys: {str(e)}")
+                delay = RETRY_INTERVAL
+            self.wake.wait(delay)
+            self.wake.clear()
+
+
+# Verifies Firebase ID tokens the way firebase_admin.auth.verify_id_token does
+# (RS256 signature, aud, iss, sub, exp, iat) and caches the decoded claims by token
+# hash until the token expires, so repeat requests skip the RSA check.
+class TokenVerifier:
+    def __init__(self, project_id, keys=None, cache_size=TOKEN_CACHE_SIZE, clock_skew=0):
+        self.project_id = project_id
+        self.issuer = ISSUER_PREFIX + project_id
+        self.keys = keys or PublicKeyCache()
+        self.cache = LRUCache(cache_size)
+        self.clock_skew = clock_skew
+
+    def verify(self, id_token):
+        token_hash = hashlib.sha256(id_token.encode()).digest()
+        decoded = self.cache.get(token_hash)
+        if decoded is not None and decoded['exp'] > time.time():
+            return decoded
+        decoded = self._verify(id_token)
+        self.cache.put(token_hash, decoded, ttl=max(decoded['exp'] - time.time(), 0))
+        return decoded
+
+    def _verify(self, id_token):
+        try:
+            header = jwt.get_unverified_header(id_token)
+        except jwt.PyJWTError as e:
+            raise InvalidTokenError(f"Malformed ID token: {str(e)}")
+        if header.get('alg') != 'RS256':
+            raise InvalidTokenError(f"ID token has incorrect algorithm {header.get('alg')}")
+        key = self.keys.get(header.get('kid'))
+        if key is None:
+            raise InvalidTokenError(f"ID token has unknown key id {header.get('kid')}")
+        try:
+            decoded = jwt.decode(id_token, key, algorithms=['RS256'], audience=self.project_id,
+                                 issuer=self.issuer, leeway=self.clock_skew,
+                                 options={'require': ['exp', 'iat', 'aud', 'iss', 'sub']})
+        except jwt.PyJWTError as e:
+            raise InvalidTokenError(f"Invalid ID token: {str(e)}")
+        subject = decoded['sub']
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise InvalidTokenError("ID token has an invalid sub (subject) claim")
+        decoded['uid'] = subject
+        return decoded
+
+
+# Signs Firebase-shaped ID tokens with a local RSA key, for testing and benchmarking
+# the verifier offline: TokenVerifier(project_id, PublicKeyCache(signer.fetch_keys))
+class FakeTokenSigner:
+    def __init__(self, project_id='demo-project', kid='fake-key'):
+        self.project_id = project_id
+        self.kid = kid
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def sign(self, uid, email=None, lifetime=3600, now=None):
+        now = int(time.time() if now is None else now)
+        claims = {'iss': ISSUER_PREFIX + self.project_id, 'aud': self.project_id, 'sub': uid,
+                  'iat': now, 'auth_time': now, 'exp': now + lifetime}
+        if email:
+            claims['email'] = email
+        return jwt.encode(claims, self.private_key, algorithm='RS256', headers={'kid': self.kid})
+
+    def fetch_keys(self):
+        return {self.kid: self.private_key.public_key()}, 3600
@@ -0,0 +1,143 @@
+from collections import namedtuple
+
+import numpy as np
+
+from metrics import STAGE_SECONDS
+
+# One seat: its closing ranks across years form a time series
+SEAT_KEY_COLUMNS = ['Institute', 'Program', 'Category', 'Quota', 'Seat Type', 'Round']
+
+# Seat types were not recorded before 2023. Those rows are counted as WBJEE seats,
+# the pool most seats belong to, so their series continue into later years. JEE(Main)
+# seats close on the JEE(Main) rank scale, so a WBJEE rank is only scored against
+# WBJEE seats unless another seat type is asked for.
+UNRECORDED_SEAT_TYPE = 'Unknown'
+DEFAULT_SEAT_TYPE = 'Wbjee Seats'
+
+# Weight of a year relative to the year after it when fitting the trend
+RECENCY_WEIGHT = 0.7
+# Share of the fitted slope carried into the target year. Series are short and noisy,
+# so a full linear extrapolation overshoots.
+TREND_DAMPING = 0.25
+# Floor on the year-to-year spread of a cutoff, as a share of the expected cutoff and
+# in ranks. Series of one or two years fit exactly, so the floor is their spread.
+# Damping, recency weight and spread were chosen by backtesting 2024 from 2021-2023
+# (benchmarks/bench_trends.py).
+RELATIVE_SPREAD = 0.35
+MIN_SPREAD = 50.0
+# Logistic approximation of the normal CDF: 1 / (1 + exp(-1.702 z))
+LOGISTIC_SCALE = 1.702
+
+# Seats ordered by admission likelihood for one rank
+TrendScores = namedtuple('TrendScores', ['keys', 'likelihood', 'target_year'])
+
+
+# Closing-rank history per seat key with a trend-adjusted expected cutoff and spread,
+# precomputed from a Table. Keys are rows of code arrays into the table's categories;
+# per-year ranks are a keys x years matrix with NaN for years without the seat. When a
+# seat appears more than once in a year (e.g. under two streams) the most lenient
+# opening and closing ranks are kept.
+class TrendTable:
+    def __init__(self, table, target_year=None):
+        self.categories = {col: table.categories[col] for col in SEAT_KEY_COLUMNS}
+        self.lookup = {col: {value: code for code, value in enumerate(cats)} for col, cats in self.categories.items()}
+        codes = {col: table.columns[col] for col in SEAT_KEY_COLUMNS}
+        unrecorded = self.lookup['Seat Type'].get(UNRECORDED_SEAT_TYPE)
+        default = self.lookup['Seat Type'].get(DEFAULT_SEAT_TYPE)
+        if unrecorded is not None and default is not None:
+            codes['Seat Type'] = np.where(codes['Seat Type'] == unrecorded, default, codes['Seat Type'])
+
+        year_values = table.columns['Year']
+        # Rows without a year or a closing rank add nothing to a series
+        valid = (year_values > 0) & ~np.isnan(table.columns['Closing Rank'])
+        # Pack each row's codes into one integer (missing -1 shifted to 0) so keys are
+        # found with a 1-d unique
+        packed = np.zeros(int(valid.sum()), dtype=np.int64)
+        for col in SEAT_KEY_COLUMNS:
+            packed = packed * (len(self.categories[col]) + 1) + codes[col][valid] + 1
+        keys, key_ids = np.unique(packed, return_inverse=True)
+        unpacked = {}
+        for col in reversed(SEAT_KEY_COLUMNS):
+            keys, code = np.divmod(keys, len(self.categories[col]) + 1)
+            unpacked[col] = (code - 1).astype(np.int16 if len(self.categories[col]) < 2 ** 15 else np.int32)
+        self.key_codes = {col: unpacked[col] for col in SEAT_KEY_COLUMNS}
+        self.years = np.unique(year_values[valid])
+        year_ids = np.searchsorted(self.years, year_values[valid])
+        num_keys = len(self.key_codes['Institute'])
+        self.closing = np.full((num_keys, len(self.years)), np.nan, dtype=np.float32)
+        self.opening = np.full((num_keys, len(self.years)), np.nan, dtype=np.float32)
+        np.fmax.at(self.closing, (key_ids, year_ids), table.columns['Closing Rank'][valid].astype(np.float32))
+        np.fmin.at(self.opening, (key_ids, year_ids), table.columns['Opening Rank'][valid].astype(np.float32))
+        self.target_year = int(self.years[-1]) + 1 if target_year is None else target_year
+        self.expected, self.slope, self.spread = self._fit(self.target_year)
+        self.nbytes = sum(a.nbytes for a in [self.closing, self.opening, self.expected, self.slope, self.spread])
+        self.nbytes += sum(a.nbytes for a in self.key_codes.values())
+
+    def __len__(self):
+        return len(self.closing)
+
+    # Recency-weighted least-squares line through each key's closing ranks, evaluated
+    # at target_year. Returns expected cutoff, slope (ranks per year) and spread.
+    def _fit(self, target_year):
+        observed = ~np.isnan(self.closing)
+        weights = np.where(observed, RECENCY_WEIGHT ** (self.years[-1] - self.years).astype(np.float64), 0.0)
+        ranks = np.where(observed, self.closing, 0.0)
+        total = weights.sum(axis=1)
+        x = (self.years - self.years[-1]).astype(np.float64)
+        x_mean = (weights * x).sum(axis=1) / total
+        y_mean = (weights * ranks).sum(axis=1) / total
+        dx = x - x_mean[:, None]
+        variance = (weights * dx * dx).sum(axis=1)
+        covariance = (weights * dx * (ranks - y_mean[:, None])).sum(axis=1)
+        slope = np.divide(covariance, variance, out=np.zeros_like(covariance), where=variance > 0)
+        fitted = y_mean[:, None] + slope[:, None] * dx
+        residual = np.sqrt((weights * (ranks - fitted) ** 2).sum(axis=1) / total)
+        expected = np.maximum(y_mean + TREND_DAMPING * slope * (target_year - self.years[-1] - x_mean), 1.0)
+        spread = np.maximum(residual, np.maximum(RELATIVE_SPREAD * expected, MIN_SPREAD))
+        return expected.astype(np.float32), slope.astype(np.float32), spread.astype(np.float32)
+
+    # Key ids whose columns equal every value in filters; other columns are ignored
+    def select(self, filters):
+        mask = np.ones(len(self), dtype=bool)
+        for col, value in filters.items():
+            if col not in self.key_codes:
+                continue
+            code = self.lookup[col].get(value)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            mask &= self.key_codes[col] == code
+        return np.flatnonzero(mask)
+
+    # Chance that each key's cutoff in the target year is at or beyond rank
+    def likelihood(self, rank, keys):
+        z = (rank - self.expected[keys]) / self.spread[keys]
+        return 1.0 / (1.0 + np.exp(np.clip(LOGISTIC_SCALE * z, -50, 50)))
+
+    # Keys matching filters, most likely admission first, then the more competitive
+    # seat first among equals. Without a seat type filter only WBJEE seats are scored.
+    def score(self, rank, filters, min_likelihood=0.0):
+        with STAGE_SECONDS.time('trend'):
+            keys = self.select(dict({'Seat Type': DEFAULT_SEAT_TYPE}, **filters))
+            likelihood = self.likelihood(rank, keys)
+            keep = likelihood >= min_likelihood
+            keys, likelihood = keys[keep], likelihood[keep]
+            order = np.lexsort((self.expected[keys], -likelihood))
+            return TrendScores(keys[order], likelihood[order], self.target_year)
+
+    # Decoded rows for the given keys, for the API
+    def records(self, keys, likelihood):
+        records = []
+        for key, p in zip(keys.tolist(), likelihood.tolist()):
+            record = {}
+            for col in SEAT_KEY_COLUMNS:
+                code = self.key_codes[col][key]
+                record[col] = self.categories[col][code] if code >= 0 else None
+            observed = ~np.isnan(self.closing[key])
+            record['Closing Ranks'] = {int(year): int(rank) for year, rank in zip(self.years[observed], self.closing[key][observed])}
+            opened = ~np.isnan(self.opening[key])
+            record['Opening Ranks'] = {int(year): int(rank) for year, rank in zip(self.years[opened], self.opening[key][opened])}
+            record['Expected Closing Rank'] = int(round(float(self.expected[key])))
+            record['Trend Per Year'] = int(round(float(self.slope[key])))
+            record['Likelihood'] = round(p, 3)
+            records.append(record)
+        return records